@@ -1,5 +1,6 @@
 import pygame
-import math
+
+from sim import SimPlayer, SimZombie, SimCultist
 
 ZOMBIE_SPRITE_PATH = "Game_models/Monsters/Zombie/Zombie.png"
 CULTIST_SPRITE_PATH = "Game_models/Monsters/Cultist.png"
@@ -7,8 +8,24 @@ INITIAL_PLAYER_SPRITE_PATH = "Game_models/Characters/Player.png"
 OTHER_PLAYER_1_SPRITE_PATH = "Game_models/Characters/other_player1.png"
 OTHER_PLAYER_2_SPRITE_PATH = "Game_models/Characters/other_player2.png"
 
+def _sim_attribute(name):
+    """Property that reads and writes the wrapped sim entity's attribute."""
+    return property(lambda self: getattr(self.sim, name), lambda self, value: setattr(self.sim, name, value))
+
+
 class Entity:
-    def __init__(self, sprite_sheet_path, x, y, speed, frame_width, frame_height, scale_factor=2, max_health=100, load_sprites=True):
+    """Sprites and drawing around a sim entity, which holds the position and health."""
+    x = _sim_attribute("x")
+    y = _sim_attribute("y")
+    speed = _sim_attribute("speed")
+    width = _sim_attribute("width")
+    height = _sim_attribute("height")
+    max_health = _sim_attribute("max_health")
+    current_health = _sim_attribute("current_health")
+    facing_left = _sim_attribute("facing_left")
+
+    def __init__(self, sprite_sheet_path, sim, frame_width, frame_height, scale_factor=2, load_sprites=True):
+        self.sim = sim
         # Load the sprite sheet
         if load_sprites:
             self.sprite_sheet = pygame.image.load(sprite_sheet_path).convert_alpha()
@@ -23,18 +40,6 @@ class Entity:
         self.animation_speed = 0.1  # Adjust for slower or faster animation
         self.animation_timer = 0
 
-        # Entity properties
-        self.width = self.frame_width * scale_factor
-        self.height = self.frame_height * scale_factor
-        self.x = x
-        self.y = y
-        self.speed = speed
-        self.facing_left = False  # Track the direction the entity is facing
-
-        # Health system
-        self.max_health = max_health
-        self.current_health = max_health
-
         # Font for health display
         if load_sprites:
             self.font = pygame.font.Font(None, 24)  # Default font, size 24
@@ -58,8 +63,7 @@ class Entity:
         return frames
 
     def move(self, dx, dy):
-        self.x += dx
-        self.y += dy
+        self.sim.move(dx, dy)
 
     def update_animation(self, dt):
         """Update the animation frame based on time."""
@@ -104,9 +108,7 @@ class Entity:
 
     def take_damage(self, damage):
         """Reduce health when the entity takes damage."""
-        self.current_health -= damage
-        if self.current_health <= 0:
-            self.current_health = 0
+        if self.sim.take_damage(damage):
             self.on_death()
 
     def on_death(self):
@@ -116,7 +118,7 @@ class Entity:
 
 class Player(Entity):
     def __init__(self, x, y, speed, sprite_path, scale_factor=1, load_sprites=True):
-        super().__init__(sprite_path, x, y, speed, frame_width=65, frame_height=65, scale_factor=scale_factor, max_health=100, load_sprites=load_sprites)
+        super().__init__(sprite_path, SimPlayer(x, y, speed, scale_factor=scale_factor), frame_width=65, frame_height=65, scale_factor=scale_factor, load_sprites=load_sprites)
         self.load_sprites = load_sprites
 
     def move(self, keys, dt):
@@ -136,128 +138,51 @@ class Player(Entity):
             self.update_animation(dt)
 
 
-class Zombie(Entity):
-    def __init__(self, x, y, speed=1, scale_factor=1, load_sprites=True):
-        super().__init__(ZOMBIE_SPRITE_PATH, x, y, speed, frame_width=65, frame_height=65, scale_factor=scale_factor, max_health=50, load_sprites=load_sprites)
-        self.attack_damage = 10  # Damage dealt by the zombie
-        self.attack_cooldown = 1.0  # Cooldown time between attacks (in seconds)
-        self.last_attack_time = 0  # Time of the last attack
-        self.attack_range = 100  # Range within which the zombie can attack
-        self.original_x = x  # Store the original x position
-        self.original_y = y  # Store the original y position
+class Enemy(Entity):
+    """Rendering side of a zombie or cultist, the chasing and attacking is done by the sim entity."""
+    sim_class = None
+    sprite_path = None
+
+    def __init__(self, x, y, speed=None, scale_factor=1, load_sprites=True):
+        super().__init__(self.sprite_path, self.sim_class(x, y, speed, scale_factor), frame_width=65, frame_height=65, scale_factor=scale_factor, load_sprites=load_sprites)
         self.load_sprites = load_sprites
 
     def follow_player(self, player_x, player_y, dt):
-        """Make the zombie follow the player unless the player is within attack range."""
-        # Calculate the distance to the player
-        distance = math.sqrt((self.x - player_x) ** 2 + (self.y - player_y) ** 2)
-
-        # Stop moving if the player is within attack range
-        if distance <= self.attack_range:
-            return
-
-        # Otherwise, move toward the player
-        dx, dy = 0, 0
-        if self.x < player_x:
-            dx = self.speed
-            self.facing_left = False
-        elif self.x > player_x:
-            dx = -self.speed
-            self.facing_left = True
-
-        if self.y < player_y:
-            dy = self.speed
-        elif self.y > player_y:
-            dy = -self.speed
-
-        super().move(dx, dy)
-        if self.load_sprites:
+        """Make the enemy follow the player unless the player is within attack range."""
+        if self.sim.follow_player(player_x, player_y) and self.load_sprites:
             self.update_animation(dt)
 
     def attack_player(self, coords, current_time):
         """Attack the player if within range and cooldown has passed."""
-        distance = math.sqrt((self.x - coords[0]) ** 2 + (self.y - coords[1]) ** 2)
-        if distance <= self.attack_range and current_time - self.last_attack_time >= self.attack_cooldown:
-            if self.weapon:
-                print(f"Zombie attacks with {self.weapon.description}!")
-                self.weapon.start_slash()  # Trigger weapon slash animation
-            #player.take_damage(self.attack_damage)
-            self.last_attack_time = current_time
-            # print(f"Zombie attacked Player! Player's health: {player.current_health}")
-            return True
-        return False
+        if not self.sim.attack_player(coords, current_time):
+            return False
+        if self.weapon:
+            print(f"{self.__class__.__name__} attacks with {self.weapon.description}!")
+            self.on_attack()
+        return True
+
+    def on_attack(self):
+        pass
 
     def on_death(self):
-        """Handle zombie death and respawn."""
+        """Handle enemy death and respawn."""
         print(f"{self.__class__.__name__} has died. Respawning...")
-        self.x = self.original_x  # Reset to original x position
-        self.y = self.original_y  # Reset to original y position
-        self.current_health = self.max_health  # Reset health
+        self.sim.respawn()
 
     def get_rect(self):
-        """Return the bounding rectangle of the zombie."""
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-
-class Cultist(Entity):
-    def __init__(self, x, y, speed=2, scale_factor=1, load_sprites=True):
-        super().__init__(CULTIST_SPRITE_PATH, x, y, speed, frame_width=65, frame_height=65, scale_factor=scale_factor, max_health=100, load_sprites=load_sprites)
-        self.attack_damage = 15  # Damage dealt by the cultist
-        self.attack_cooldown = 1.5  # Cooldown time between attacks (in seconds)
-        self.last_attack_time = 0  # Time of the last attack
-        self.attack_range = 120  # Range within which the cultist can attack
-        self.original_x = x  # Store the original x position
-        self.original_y = y  # Store the original y position
-        self.load_sprites = load_sprites
+        """Return the bounding rectangle of the enemy."""
+        return pygame.Rect(*self.sim.get_rect())
 
 
-    def follow_player(self, player_x, player_y, dt):
-        """Make the cultist follow the player unless the player is within attack range."""
-        # Calculate the distance to the player
-        distance = math.sqrt((self.x - player_x) ** 2 + (self.y - player_y) ** 2)
-
-        # Stop moving if the player is within attack range
-        if distance <= self.attack_range:
-            return
-
-        # Otherwise, move toward the player
-        dx, dy = 0, 0
-        if self.x < player_x:
-            dx = self.speed
-            self.facing_left = False
-        elif self.x > player_x:
-            dx = -self.speed
-            self.facing_left = True
-
-        if self.y < player_y:
-            dy = self.speed
-        elif self.y > player_y:
-            dy = -self.speed
-
-        super().move(dx, dy)
-        if self.load_sprites:
-            self.update_animation(dt)
+class Zombie(Enemy):
+    sim_class = SimZombie
+    sprite_path = ZOMBIE_SPRITE_PATH
 
-    def attack_player(self, coords, current_time):
-        """Attack the player if within range and cooldown has passed."""
-        distance = math.sqrt((self.x - coords[0]) ** 2 + (self.y - coords[1]) ** 2)
-        if distance <= self.attack_range and current_time - self.last_attack_time >= self.attack_cooldown:
-            if self.weapon:
-                print(f"Cultist attacks with {self.weapon.description}!")
-                # Add logic for bow attack (e.g., shooting arrows)
-            #player.take_damage(self.attack_damage)
-            self.last_attack_time = current_time
-            #print(f"Cultist attacked Player! Player's health: {player.current_health}")
-            return True
-        return False
+    def on_attack(self):
+        self.weapon.start_slash()  # Trigger weapon slash animation
 
-    def on_death(self):
-        """Handle cultist death and respawn."""
-        print(f"{self.__class__.__name__} has died. Respawning...")
-        self.x = self.original_x  # Reset to original x position
-        self.y = self.original_y  # Reset to original y position
-        self.current_health = self.max_health  # Reset health
 
-    def get_rect(self):
-        """Return the bounding rectangle of the cultist."""
-        return pygame.Rect(self.x, self.y, self.width, self.height)
\ No newline at end of file
+class Cultist(Enemy):
+    sim_class = SimCultist
+    sprite_path = CULTIST_SPRITE_PATH
+    # Add logic for bow attack (e.g., shooting arrows) in on_attack
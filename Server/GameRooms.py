@@ -1,113 +1,136 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import WebSocket
 from typing import Dict
 import asyncio
-import math
 import random
+from collections import deque
+
+from enemy_store import EnemyStore
+from projectiles import ArrowPool
+from spawn_director import SpawnDirector, spawn_candidates
+from sim import SimPlayer, Swing, slash_rect, rects_overlap, SWORD_DAMAGE, SLASH_SIZE, FRAME_SIZE, BOW_ATTACK_SPEED
+from flow_field import FlowField
+from scheduler import TickScheduler, MAX_CATCH_UP_TICKS
+from room_manager import RoomManager
+from sim_workers import WorkerPool
+from snapshots import take_snapshot, interest_view, keyframe_message, diff_views, merge_view, prioritise, state_message, empty_state, RecordCache
+from wire import JsonCodec
+from connections import ClientConnection
+from history import StateHistory
+from spatial import UniformGrid
 
-from Entities import Entity, Zombie, Cultist
-
-rooms : Dict[str, "GameRoom"] = {}
 INITIAL_PLAYER_COORD = {'x' : 0, 'y' : 0}
 PLAYERS_IN_ROOM = 2
 TICK_RATE = 1 / 30  # 30 updates per second
+IDLE_TICK_RATE = 1 / 10  # for rooms where nobody has sent an input for IDLE_AFTER seconds
+IDLE_AFTER = 10
+SNAPSHOT_RATE = 15  # state updates per second at most, clients interpolate in between
 DIFICULTY_MULTIPLIER = 1.5
 INITIAL_HEALTH = 100
+MAX_PLAYER_SPEED = 23 * 60  # px per second on each axis, a client moving SPEED every frame at 60 fps
+MAX_INPUT_STEP = MAX_PLAYER_SPEED * TICK_RATE  # px on each axis, the most a single move message is taken for
+MAX_QUEUED_INPUTS = 64  # per player, older inputs are dropped if a client floods the server
+
+# lag compensation: swings are resolved against the positions the attacker saw
+MAX_REWIND = 0.25  # seconds, how far back a swing can rewind the room
+SWING_SEARCH_RADIUS = 2 * (SLASH_SIZE + FRAME_SIZE)  # px around the slash for the candidate enemies, wide enough for the rewind
 global_dt = 0
 
 WIDTH = 800
 HEIGHT = 600
+# the playable area (x0, y0, x1, y1), 3 x 3 screens around the spawn area; players are kept
+# inside it and the enemies' flow field never grows past it
+MAP_BOUNDS = (-WIDTH, -HEIGHT, 2 * WIDTH, 2 * HEIGHT)
 SPAWN_MARGIN = 50
 MIN_DISTANCE_FROM_PLAYER = 100
 
 SPAWN_MARGIN_PLAYER = 100
 MIN_DISTANCE_BETWEEN_PLAYERS = 75
 
+# area of interest: a client only gets the entities within this distance of its player,
+# the radius covers the corners of the WIDTH x HEIGHT camera window
+INTEREST_RADIUS = int((WIDTH ** 2 + HEIGHT ** 2) ** 0.5 / 2)
+INTEREST_MARGIN = 100  # extra distance before an entity leaves the view again
+
+scheduler = TickScheduler(TICK_RATE)  # steps every running room
+worker_pool = WorkerPool()  # simulates the rooms in other processes when GAME_SIM_WORKERS is set
+
 class GameRoom:
     def __init__(self, room_id):
         self.room_id = room_id
-        self.players : Dict[str, WebSocket] = {}
-        self.state : Dict[str, Dict[str, int]]= {} # for the coord of all players
+        self.players : Dict[str, ClientConnection] = {}
+        self.state : Dict[str, SimPlayer] = {} # for the coord of all players
         self.running = False
-        self.lock = asyncio.Lock() # This prevents data races when multiple coroutines (players) try to read/write shared data at the same time
-        self.loop_task = None
+        self.slot = None  # stagger slot in the scheduler while the room is running
+        self.sim_time = None  # loop time of the last simulated tick
+        self.late_ticks = 0  # ticks simulated late, to catch up
+        self.skipped_ticks = 0  # ticks dropped because the room was too far behind
+        self.last_input_at = 0  # loop time of the last player input, the room idles without them
         self.started_at = None
         self.position_index = 0
-        self.enemies : Dict[int, Zombie] = {}
-        self.cultists : Dict[int, Cultist] = {}
+        # zombies ("enemies") and cultists, in NumPy arrays; the ones nobody can see are updated less often
+        self.enemy_store = EnemyStore(far_distance=INTEREST_RADIUS + INTEREST_MARGIN)
+        self.flow_field = FlowField(MAP_BOUNDS)  # where the enemies walk, shared by all of them
+        self.director = SpawnDirector(spawn_candidates(SPAWN_MARGIN, SPAWN_MARGIN, WIDTH - SPAWN_MARGIN, HEIGHT - SPAWN_MARGIN),
+                                      int(PLAYERS_IN_ROOM * DIFICULTY_MULTIPLIER), MIN_DISTANCE_FROM_PLAYER)
         self.dead_players = []
-
+        self.snapshot_seq = 0
+        # published at the end of every tick and never changed afterwards, so the state updates and the
+        # socket handlers can read it without a lock while the next tick builds a new one
+        self.last_snapshot = None
+        self.record_cache = RecordCache()  # encoded enemy records, shared by every client's updates
+        self.tick = 0
+        self.inputs : Dict[str, deque] = {}  # player_id -> (tick, seq, dx, dy) waiting for the next tick
+        self.last_input_seq : Dict[str, int] = {}  # last input seq applied per player, echoed in state updates
+        self.history = StateHistory(int(MAX_REWIND / TICK_RATE) + 2)  # recent ticks for the lag compensation
+        self.pending_swings : Dict[str, tuple] = {}  # player_id -> (seq, facing_left, rewind) for the next tick
+        self.swings : Dict[str, Swing] = {}  # active sword swings
+        self.arrows = ArrowPool()  # arrows in flight
+        self.pending_shots : Dict[str, tuple] = {}  # player_id -> (dx, dy) aim of the next shot
+        self.last_shot_at : Dict[str, float] = {}
+        self.player_handles : Dict[str, int] = {}  # player_id -> small int used by the binary encoding
+        self.player_grid = UniformGrid()  # player positions for the proximity queries, kept up to date as they move
+        self.worker = None  # sim_workers.RoomLink when a worker process simulates the room
 
     def is_ready(self):
         return len(self.players) == PLAYERS_IN_ROOM
 
-    def get_random_spawn_location(self):
-        max_attempts = 20
-        for _ in range(max_attempts):
-            x = random.randint(SPAWN_MARGIN, WIDTH - SPAWN_MARGIN)
-            y = random.randint(SPAWN_MARGIN, HEIGHT - SPAWN_MARGIN)
-
-            too_close = False
-            for player in self.state.values():
-                dx = player["x"] - x
-                dy = player["y"] - y
-                dist = (dx ** 2 + dy ** 2) ** 0.5
-                if dist < MIN_DISTANCE_FROM_PLAYER:
-                    too_close = True
-                    break
-
-            if not too_close:
-                return x, y
-
-        # fallback
-        return WIDTH // 2, HEIGHT // 2
-
-    async def initialize_enemies(self, difficulty_multiplier=DIFICULTY_MULTIPLIER):
-        num_enemies = int(PLAYERS_IN_ROOM * difficulty_multiplier)
-
-        for i in range(num_enemies):
-            x, y = self.get_random_spawn_location()
-            if i % 2 == 0:
-                self.enemies[i] = (Zombie(x, y, load_sprites=False))
-            else:
-                self.cultists[i] = (Cultist(x, y, load_sprites=False))
-
     def all_enemies_killed(self):
-        if self.enemies is None and self.cultists is None:
-            return True
-        return False
-
-    async def remove_enemy(self, enemy_id : int, killer : str):
-        if enemy_id in self.enemies:
-            self.enemies.pop(enemy_id, None)
-            await self.broadcast_enemy_killed(enemy_id)
-            if self.all_enemies_killed():
-                await self.broadcast_winner(killer)
-                await self.shutdown()
-
-    async def remove_cultist(self, cultist_id : int, killer : str):
-        if cultist_id in self.enemies:
-            self.cultists.pop(cultist_id, None)
-            await self.broadcast_cultist_killed(cultist_id)
-            if self.all_enemies_killed():
-                await self.broadcast_winner(killer)
-                await self.shutdown()
+        return len(self.enemy_store) == 0 and self.director.done()
+
+    def kill_enemy(self, kind : str, enemy_id : int, killer : str):
+        if not self.enemy_store.remove(kind, enemy_id):
+            return
+        if kind == "enemies":
+            self.broadcast_enemy_killed(enemy_id)
+        else:
+            self.broadcast_cultist_killed(enemy_id)
+        if self.all_enemies_killed():
+            self.broadcast_winner(killer)
+            self.end_game()
+
+    def end_game(self):
+        asyncio.create_task(self.shutdown())
 
     async def start_game(self):
         print("starting game")
         self.running = True
         self.started_at = asyncio.get_running_loop().time()
-        # initiate the Enemies
-        await self.initialize_enemies()
+        # the enemies come in waves from the first tick on
+        self.director.start(self.started_at)
         # send the starting Message
-        start_msg = {"type": "start_game", "players": self.state,
-                     "enemies": [{"id": k, "x": e.x, "y": e.y, "health": e.current_health} for k, e in self.enemies.items()],
-                      "cultists": [{"id": k, "x": e.x, "y": e.y, "health": e.current_health} for k, e in self.cultists.items()]}
-        for ws in self.players.values():
-            try:
-                await ws.send_json(start_msg)
-            except:
-                pass
-        self.loop_task = asyncio.create_task(self.game_loop())
+        snapshot = take_snapshot(self.state, self.enemy_store)
+        self.last_snapshot = snapshot
+        for player_id in self.players:
+            view = interest_view(snapshot, player_id, None, INTEREST_RADIUS, INTEREST_MARGIN)
+            start_msg = keyframe_message(0, view, self.record_cache)
+            start_msg.update({"type": "start_game", "handles": self.player_handles})
+            self.send(player_id, start_msg)
+        self.last_input_at = self.started_at
+        room_manager.started(self)
+        if worker_pool.enabled():
+            # from now on the simulation runs in a worker, this room only sends the state
+            self.enemy_store = worker_pool.attach(self)
+        scheduler.add(self)
 
     def get_random_player_spawn(self):
         max_attempts = 25
@@ -115,172 +138,378 @@ class GameRoom:
             x = random.randint(SPAWN_MARGIN_PLAYER, WIDTH - SPAWN_MARGIN_PLAYER)
             y = random.randint(SPAWN_MARGIN_PLAYER, HEIGHT - SPAWN_MARGIN_PLAYER)
 
-            too_close = False
-            for player in self.state.values():
-                dx, dy = x - player['x'], y - player['y']
-                if (dx ** 2 + dy ** 2) ** 0.5 < MIN_DISTANCE_BETWEEN_PLAYERS:
-                    too_close = True
-                    break
-
-            if not too_close:
+            if not self.player_grid.any_within(x, y, MIN_DISTANCE_BETWEEN_PLAYERS):
                 return x, y
 
         # fallback: center of map
         return WIDTH // 2, HEIGHT // 2
 
-    async def add_player(self, player_id: str, player_ws: WebSocket):
-        async with self.lock:
-            self.players[player_id] = player_ws
-            print("len layers", len(self.players))
+    async def add_player(self, player_id: str, player_ws: WebSocket, codec=None):
+        # nothing is awaited before the game starts, so no other coroutine sees a half added player
+        codec = codec or JsonCodec()
+        self.player_handles[player_id] = len(self.player_handles)  # never reused, so stale ids still decode
+        codec.set_handles(self.player_handles)
+        self.players[player_id] = ClientConnection(player_ws, codec, max(TICK_RATE, 1 / SNAPSHOT_RATE))
+        self.inputs[player_id] = deque(maxlen=MAX_QUEUED_INPUTS)
+        print("len layers", len(self.players))
 
-            x, y = self.get_random_player_spawn()
-            self.state[player_id] = {"x": x, "y": y, "health": INITIAL_HEALTH}
+        x, y = self.get_random_player_spawn()
+        self.state[player_id] = SimPlayer(x, y, MAX_PLAYER_SPEED, INITIAL_HEALTH)
+        self.player_grid.insert(player_id, x, y)
 
-        if self.is_ready():
+        if self.is_ready() and not self.running:
             await self.start_game()
 
-    # will be invoked in the Pygame when a player is killed
-    async def remove_player(self, player_id: str):
-        if player_id in self.players:
-            ws = self.players[player_id]
-            if ws:
-                await ws.close()
-            self.players.pop(player_id, None)
-            self.state.pop(player_id, None)
-
-
-    async def get_closest_player(self, enemy):
-        pl_cords = None
-        min_distance = float('inf')
-
-        for player, pos in self.state.items():
-            x, y = pos["x"], pos["y"]
-            dist = math.hypot(enemy.x - x, enemy.y - y)
-            if dist < min_distance:
-                pl_cords = player, [x, y]
-                min_distance = dist
+    def reconnect_player(self, player_id: str, player_ws: WebSocket, codec):
+        """A player of a room handed off from another server is back; the room starts ticking with the first one."""
+        codec.set_handles(self.player_handles)
+        self.players[player_id] = ClientConnection(player_ws, codec, max(TICK_RATE, 1 / SNAPSHOT_RATE))
+        self.inputs[player_id] = deque(maxlen=MAX_QUEUED_INPUTS)
+        if self.slot is None:
+            scheduler.add(self)
 
-        return pl_cords
+    def redirect(self, ws_url):
+        """The room lives on in another server, send the players there."""
+        self.running = False
+        scheduler.remove(self)
+        self.broadcast({"type": "redirect", "ws_url": ws_url})
+        connections = list(self.players.values())
+        self.players.clear()
+        for connection in connections:
+            asyncio.create_task(connection.close())
+        room_manager.remove(self)
+
+    def detach_player(self, player_id: str):
+        """Forget the player, returns its connection (None if it already left)."""
+        if player_id not in self.players:
+            return None
+        connection = self.players.pop(player_id)
+        self.state.pop(player_id, None)
+        self.player_grid.remove(player_id)
+        self.inputs.pop(player_id, None)
+        self.last_input_seq.pop(player_id, None)
+        self.pending_swings.pop(player_id, None)
+        self.swings.pop(player_id, None)
+        self.pending_shots.pop(player_id, None)
+        self.last_shot_at.pop(player_id, None)
+        return connection
 
-    async def broadcast_cultist_killed(self, cultist_id):
+    # will be invoked in the Pygame when a player is killed
+    async def remove_player(self, player_id: str):
+        connection = self.detach_player(player_id)
+        if connection:
+            if not self.running:
+                room_manager.seat_freed(self)
+            if self.worker:
+                worker_pool.remove_player(self, player_id)
+            await connection.close()
+
+    def send(self, player_id: str, msg, reliable=True):
+        connection = self.players.get(player_id)
+        if connection:
+            connection.enqueue(connection.codec.encode(msg), reliable)
+
+    def broadcast(self, msg, reliable=True):
+        payloads = {}  # codec name -> payload, so the message is encoded once per wire format
+        for connection in self.players.values():
+            name = connection.codec.name
+            if name not in payloads:
+                payloads[name] = connection.codec.encode(msg)
+            connection.enqueue(payloads[name], reliable)
+
+    def in_game(self, player_id: str):
+        """From the published snapshot, the player was alive at the end of the last tick."""
+        return self.last_snapshot is not None and player_id in self.last_snapshot["players"]
+
+    def queue_input(self, player_id: str, seq: int, dx, dy):
+        """Called by the socket reader, the input is applied by the next tick (no lock needed)."""
+        if self.worker:
+            self.worker.push_move(self.player_handles[player_id], seq, dx, dy)
+            return
+        queue = self.inputs.get(player_id)
+        if queue is not None:
+            queue.append((self.tick, seq, dx, dy))
+            if dx or dy:
+                self.wake()  # standing still doesn't keep the room at the full rate
+
+    def wake(self):
+        """A player did something, the room goes back to the full tick rate on its next step."""
+        self.last_input_at = asyncio.get_running_loop().time()
+
+    def tick_interval(self, now):
+        return IDLE_TICK_RATE if now - self.last_input_at > IDLE_AFTER else TICK_RATE
+
+    def apply_inputs(self, dt):
+        """Coalesce every player's queued moves into one capped step per tick."""
+        max_step = MAX_PLAYER_SPEED * dt
+        for player_id, queue in self.inputs.items():
+            if not queue:
+                continue
+            dx = dy = 0
+            seq = None
+            while queue:
+                _, seq, move_x, move_y = queue.popleft()
+                dx += move_x
+                dy += move_y
+            player = self.state.get(player_id)
+            if player:
+                player.move(max(-max_step, min(max_step, dx)), max(-max_step, min(max_step, dy)))
+                x0, y0, x1, y1 = MAP_BOUNDS
+                player.x = max(x0, min(x1 - FRAME_SIZE, player.x))
+                player.y = max(y0, min(y1 - FRAME_SIZE, player.y))
+                self.player_grid.move(player_id, player.x, player.y)
+            self.last_input_seq[player_id] = seq
+
+    def queue_swing(self, player_id: str, seq: int, facing_left: bool, view_time):
+        """Called by the socket reader, the swing starts on the next tick.
+
+        view_time is the server time the client was showing, the targets are rewound by that much.
+        """
+        if not self.in_game(player_id) or player_id in self.swings or player_id in self.pending_swings:
+            return  # still swinging
+        now = asyncio.get_running_loop().time()
+        rewind = 0 if view_time is None else max(0, min(MAX_REWIND, now - view_time))
+        if self.worker:
+            self.worker.push_swing(self.player_handles[player_id], seq, facing_left, rewind)
+            return
+        self.pending_swings[player_id] = (seq, facing_left, rewind)
+        self.wake()
+
+    def queue_shot(self, player_id: str, dx, dy):
+        """Called by the socket reader, the arrow is fired on the next tick if the bow is ready."""
+        if self.in_game(player_id):
+            if self.worker:
+                self.worker.push_shot(self.player_handles[player_id], dx, dy)
+                return
+            self.pending_shots[player_id] = (dx, dy)
+            self.wake()
+
+    def update_arrows(self, dt, current_time):
+        """Move the arrows in flight, then fire the new ones; the clients get one event with both."""
+        despawned, killed = self.arrows.step(dt, self.enemy_store)
+        if killed:
+            players = {handle: player_id for player_id, handle in self.player_handles.items()}
+            for kind, k, owner in killed:
+                self.kill_enemy(kind, k, players[owner])
+
+        spawned = []
+        for player_id, (dx, dy) in self.pending_shots.items():
+            player = self.state.get(player_id)
+            if player is None or current_time - self.last_shot_at.get(player_id, float('-inf')) < 1 / BOW_ATTACK_SPEED:
+                continue
+            x, y = player.x + player.width / 2, player.y + player.height / 2
+            arrow = self.arrows.spawn(self.player_handles[player_id], x, y, dx, dy)
+            if arrow:
+                self.last_shot_at[player_id] = current_time
+                arrow_id, vx, vy = arrow
+                spawned.append([arrow_id, round(x), round(y), round(vx), round(vy)])
+        self.pending_shots.clear()
+
+        # the clients fly the arrows themselves from the spawn event, no positions per tick
+        if spawned or despawned:
+            self.broadcast({"type": "arrows", "t": current_time, "spawn": spawned, "despawn": despawned})
+
+    def resolve_swings(self, current_time):
+        """Hit every enemy in the slash of the active swings, each one once per swing."""
+        for player_id, (seq, facing_left, rewind) in self.pending_swings.items():
+            self.swings[player_id] = Swing(seq, facing_left, rewind, current_time)
+        self.pending_swings.clear()
+
+        for player_id, swing in list(self.swings.items()):
+            player = self.state.get(player_id)
+            if player is None:
+                self.swings.pop(player_id)
+                continue
+            rect = slash_rect(player.x, player.y, swing.facing_left, player.width, player.height)
+            t = current_time - swing.rewind
+            candidates = self.enemy_store.query_radius(rect[0] + rect[2] / 2, rect[1] + rect[3] / 2, SWING_SEARCH_RADIUS)
+            for kind, ids in candidates.items():
+                for k in ids:
+                    if (kind, k) in swing.hit:
+                        continue
+                    position = self.history.position_at(kind, k, t) or self.enemy_store.position(kind, k)
+                    if not rects_overlap(rect, (position[0], position[1], FRAME_SIZE, FRAME_SIZE)):
+                        continue
+                    swing.hit[(kind, k)] = SWORD_DAMAGE
+                    if self.enemy_store.damage(kind, k, SWORD_DAMAGE) <= 0:
+                        self.kill_enemy(kind, k, player_id)
+
+            if current_time >= swing.ends_at:
+                # one event with everything the swing hit
+                self.swings.pop(player_id)
+                result = {"type": "swing_result", "seq": swing.seq, "enemies": [], "cultists": []}
+                for (kind, k), damage in swing.hit.items():
+                    result[kind].append({"id": k, "damage": damage})
+                self.send(player_id, result)
+
+    def ack_snapshot(self, player_id: str, seq: int):
+        connection = self.players.get(player_id)
+        if connection:
+            connection.ack(seq, asyncio.get_running_loop().time())
+
+
+    def broadcast_cultist_killed(self, cultist_id):
         state_msg = {"type": "cultist_killed",
                      "id": cultist_id}
+        self.broadcast(state_msg)
 
-        for ws in self.players.values():
-            try:
-                await ws.send_json(state_msg)
-            except:
-                pass
-
-    async def broadcast_enemy_killed(self, e_id):
+    def broadcast_enemy_killed(self, e_id):
         state_msg = {"type": "enemy_killed",
                      "id": e_id }
+        self.broadcast(state_msg)
 
-        for ws in self.players.values():
-            try:
-                await ws.send_json(state_msg)
-            except:
-                pass
-
-    async def broadcast_winner(self, winner : str):
+    def broadcast_winner(self, winner : str):
         state_msg = {"type": "game_ended",
                      "winner": winner}
-
-        for ws in self.players.values():
-            try:
-                await ws.send_json(state_msg)
-            except:
-                pass
-
-    async def broadcast_state(self):
-
-        state_msg = {"type": "state_update", "players": self.state,
-                     "enemies": [{"id": k, "x": e.x, "y": e.y, "health": e.current_health} for k, e in self.enemies.items()],
-                      "cultists": [{"id": k, "x": e.x, "y": e.y, "health": e.current_health} for k, e in self.cultists.items()]}
-
-        for ws in self.players.values():
-            try:
-                await ws.send_json(state_msg)
-            except:
-                pass
-
-    async def game_loop(self):
-        try:
-            previous_time = asyncio.get_running_loop().time()
-
-            while self.running:
-                await asyncio.sleep(TICK_RATE)
-
-                current_time = asyncio.get_running_loop().time()
-                dt = current_time - previous_time
-                previous_time = current_time
-
-                # Update enemies
-                for enemy in self.enemies.values():
-                    player, cords = await self.get_closest_player(enemy)
-                    print("2")
-                    if cords:
-                        enemy.follow_player(cords[0], cords[1], dt)
-                        has_attacked = enemy.attack_player(cords, current_time)
-                        if has_attacked: self.state[player]["health"] -= enemy.attack_damage
-                        if self.state[player]["health"] <= 0:
-                            # player killed
-                            self.state[player]["health"] = 0
-                            self.dead_players.append(player)
-
-
-                for cultist in self.cultists.values():
-                    player, cords = await self.get_closest_player(cultist)
-                    if cords:
-                        cultist.follow_player(cords[0], cords[1], dt)
-
-                        has_attacked = cultist.attack_player(cords, current_time)
-                        if has_attacked: self.state[player]["health"] -= cultist.attack_damage
-                        if self.state[player]["health"] <= 0:
-                            # player killed
-                            self.state[player]["health"] = 0
-                            self.dead_players.append(player)
-
-                for dead_id in self.dead_players:
-                    death_msg = {"type": "player_died", "player_id": dead_id}
-                    async with self.lock:
-                        if self.players:
-                            for ws in self.players.values():
-                                try:
-                                    await ws.send_json(death_msg)
-                                except:
-                                    pass
-                        else:
-                            self.running = False
-                            rooms.pop(self.room_id, None)
-                    await self.remove_player(dead_id)
-                self.dead_players.clear()
-
-                # Send updates to players
-                async with self.lock:
-                    if self.players:
-                        await self.broadcast_state()
-                    else:
-                        self.running = False
-                        rooms.pop(self.room_id, None)
-        except Exception as e:
-            print("Game loop error:", e)
-            self.running = False
+        self.broadcast(state_msg)
+
+    def nearby(self, x, y):
+        """Candidates for a player's interest view, {kind: ids} within the radius and margin."""
+        reach = INTEREST_RADIUS + INTEREST_MARGIN
+        found = self.enemy_store.query_radius(x, y, reach)
+        found["players"] = self.player_grid.query_radius(x, y, reach)
+        return found
+
+    def broadcast_state(self, snapshot, now):
+        self.snapshot_seq += 1
+        seq = self.snapshot_seq
+
+        # every client gets its own view at its own rate, so the state updates are encoded per client
+        for player_id, connection in self.players.items():
+            if not connection.snapshot_due(now):
+                continue
+            connection.adapt_rate()
+            own = snapshot["players"].get(player_id, (0, 0, 0))
+            view = interest_view(snapshot, player_id, connection.last_view(), INTEREST_RADIUS, INTEREST_MARGIN,
+                                 self.nearby(own[0], own[1]))
+            baseline_seq, baseline = connection.baseline()
+            if baseline is None:
+                baseline = empty_state()
+            changed, leave, removed = diff_views(baseline, view, snapshot)
+
+            # fit the changes into the client's byte budget, the rest waits for the next update
+            max_records = int(connection.byte_budget() // connection.codec.record_size)
+            changed = prioritise(changed, connection.priorities, player_id, own[:2], self.last_snapshot,
+                                 max_records, INTEREST_RADIUS + INTEREST_MARGIN)
+            for key in [key for key in connection.priorities if key[1] not in view[key[0]]]:
+                connection.priorities.pop(key)
+
+            msg = state_message(seq, baseline_seq, baseline, changed, leave, removed, self.record_cache)
+            msg["input_seq"] = self.last_input_seq.get(player_id)
+            msg["t"] = now
+            connection.send_state(seq, connection.codec.encode(msg))
+            connection.record_snapshot(seq, merge_view(baseline, changed, leave, removed), now)
+
+        self.last_snapshot = snapshot
+        self.record_cache.prune(snapshot)
+
+    def step(self, now):
+        """Run the ticks that are due by now, then send the state. Called by the scheduler."""
+        if self.worker:
+            return self.step_shared()
+        if not self.advance(now):
+            return
+        for dead_id in self.dead_players:
+            self.drop_dead_player(dead_id)
+        self.dead_players.clear()
+
+        # Send updates to players
+        if not self.players:
+            self.close_empty()
+            return
+        snapshot = take_snapshot(self.state, self.enemy_store, self.last_snapshot)
+        self.history.record(self.sim_time, snapshot)
+        self.broadcast_state(snapshot, self.sim_time)
+
+    def step_shared(self):
+        """Send the newest state the worker published, if there is a new one."""
+        if not self.players:
+            self.close_empty()
+            return
+        published = self.worker.read(self.last_snapshot)
+        if published is None:
+            return
+        self.sim_time, snapshot = published
+        for player_id, (x, y, health) in snapshot["players"].items():
+            player = self.state.get(player_id)
+            if player:
+                player.x, player.y, player.current_health = x, y, health
+                self.player_grid.move(player_id, x, y)
+        self.broadcast_state(snapshot, self.sim_time)
+
+    def advance(self, now):
+        """Simulate the ticks that are due by now, False if there were none.
+
+        An idle room ticks at IDLE_TICK_RATE with a longer dt, the next input brings it back.
+        """
+        interval = self.tick_interval(now)
+        due = int((now - self.sim_time) / interval)
+        if due <= 0:
+            return False
+        if due > MAX_CATCH_UP_TICKS:
+            # too far behind, drop the oldest ticks instead of simulating them all at once
+            self.skipped_ticks += due - MAX_CATCH_UP_TICKS
+            self.sim_time += (due - MAX_CATCH_UP_TICKS) * interval
+            due = MAX_CATCH_UP_TICKS
+        self.late_ticks += due - 1
+        for _ in range(due):
+            self.sim_time += interval
+            self.simulate(interval, self.sim_time)
+        return True
+
+    def drop_dead_player(self, player_id: str):
+        death_msg = {"type": "player_died", "player_id": player_id}
+        if self.players:
+            self.broadcast(death_msg)
+        connection = self.detach_player(player_id)
+        if connection:
+            asyncio.create_task(connection.close())
+
+    def close_empty(self):
+        """Everyone left, nobody to tell."""
+        self.running = False
+        scheduler.remove(self)
+        if self.worker:
+            worker_pool.detach(self)
+        room_manager.remove(self)
+
+    def simulate(self, dt, current_time):
+        """One fixed timestep of the room."""
+        self.tick += 1
+        self.apply_inputs(dt)
+        self.director.update(current_time, self.enemy_store, self.player_grid)
+        self.resolve_swings(current_time)
+        self.update_arrows(dt, current_time)
+
+        # Update enemies, all of them in one vectorized step
+        targets = [p for p in self.state if p not in self.dead_players]
+        target_x = [self.state[p].x for p in targets]
+        target_y = [self.state[p].y for p in targets]
+        store = self.enemy_store
+        self.flow_field.update(target_x, target_y, store.x[:store.count], store.y[:store.count])
+        damage = store.step(target_x, target_y, current_time, self.flow_field, self.tick, dt / TICK_RATE)
+        for player, dealt in zip(targets, damage.tolist()):
+            if not dealt:
+                continue
+            if self.state[player].take_damage(dealt):
+                # player killed
+                self.dead_players.append(player)
 
     async def shutdown(self):
         self.running = False
-        if self.loop_task:
-            self.loop_task.cancel()
+        scheduler.remove(self)
+        if self.worker:
+            worker_pool.detach(self)
+        room_manager.ending(self)
 
         # Notify all players that the game has ended
         shutdown_msg = {"type": "room_closed"}
-        for ws in self.players.values():
-            try:
-                await ws.send_json(shutdown_msg)
-                await ws.close()
-            except:
-                pass  # Ignore if already closed or errored
-
+        self.broadcast(shutdown_msg)
+        connections = list(self.players.values())
         self.players.clear()
+        await asyncio.gather(*(connection.close() for connection in connections))
         self.state.clear()
+        room_manager.remove(self)
+
 
+room_manager = RoomManager(GameRoom, PLAYERS_IN_ROOM)  # every room, by state
@@ -0,0 +1,68 @@
+# Compares the json and binary wire encodings for one room tick.
+# python bench_wire.py [players] [enemies]
+import random
+import sys
+import timeit
+import uuid
+
+from enemy_store import EnemyStore
+from sim import SimPlayer
+from snapshots import take_snapshot, keyframe_message, diff_views, state_message, RecordCache
+from wire import JsonCodec, BinaryCodec
+
+RUNS = 2000
+
+
+def make_room(n_players, n_enemies):
+    state = {str(uuid.uuid4()): SimPlayer(random.randint(0, 800), random.randint(0, 600), 23)
+             for _ in range(n_players)}
+    store = EnemyStore()
+    for i in range(n_enemies):
+        store.add("enemies" if i % 2 == 0 else "cultists", i, random.randint(0, 800), random.randint(0, 600))
+    return state, store
+
+
+def move_some(state, store, share=0.3):
+    for p in state.values():
+        p.move(23, 0)
+    for i in range(len(store)):
+        if random.random() < share:
+            store.x[i] += 1
+            store.y[i] -= 1
+            store.dirty[i] = True
+
+
+def bench(codec, msg):
+    payload = codec.encode(msg)
+    encode = timeit.timeit(lambda: codec.encode(msg), number=RUNS) / RUNS
+    decode = timeit.timeit(lambda: codec.decode(payload), number=RUNS) / RUNS
+    return len(payload), encode * 1e6, decode * 1e6
+
+
+def main():
+    n_players = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    n_enemies = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    state, store = make_room(n_players, n_enemies)
+    handles = {pid: i for i, pid in enumerate(state)}
+    baseline = take_snapshot(state, store)
+    move_some(state, store)
+    current = take_snapshot(state, store, baseline)
+
+    changed, leave, removed = diff_views(baseline, current, current)
+    # "cached": the enemy records come from a warm RecordCache, like most of them do in a room
+    cache = RecordCache()
+    messages = {"keyframe": keyframe_message(2, current), "delta": state_message(2, 1, baseline, changed, leave, removed),
+                "cached": keyframe_message(2, current, cache)}
+    codecs = [JsonCodec(), BinaryCodec(handles)]
+
+    print(f"{n_players} players, {n_enemies} enemies")
+    print(f"{'message':<10}{'encoding':<10}{'bytes/tick':>12}{'encode us':>12}{'decode us':>12}")
+    for name, msg in messages.items():
+        for codec in codecs:
+            size, encode_us, decode_us = bench(codec, msg)
+            print(f"{name:<10}{codec.name:<10}{size:>12}{encode_us:>12.1f}{decode_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+from collections import deque
+
+SEND_QUEUE_SIZE = 64  # messages waiting for one socket before it is considered too slow
+CLOSE_TIMEOUT = 1  # seconds a closing connection gets to flush its queue
+SNAPSHOT_HISTORY = 32  # views kept per client as delta baselines
+
+# adaptive snapshot rate, between the room's snapshot rate and MIN_SNAPSHOT_RATE
+MIN_SNAPSHOT_RATE = 5  # state updates per second for the worst links
+RTT_TOLERANCE = 0.1  # seconds of RTT above the lowest one seen before the link counts as congested
+CLIENT_BYTES_PER_SECOND = 16000  # state update budget per client
+
+
+class ClientConnection:
+    """One player's socket with its own bounded outbound queue and writer task.
+
+    The room only enqueues already encoded payloads, so a slow socket never stalls the tick.
+    Unreliable messages (state updates) are superseded by the next one, reliable ones
+    (player_died, enemy_killed, game_ended, ...) are always delivered in order.
+    """
+
+    def __init__(self, ws, codec, min_interval, max_queue=SEND_QUEUE_SIZE):
+        self.ws = ws
+        self.codec = codec
+        self.max_queue = max_queue
+
+        # replication state: the views sent to this client and the last one it acked
+        self.views = {}    # seq -> view
+        self.sent_at = {}  # seq -> loop time the view was sent (queued, until the writer sends it)
+        self.acked_seq = None
+        self.priorities = {}  # (kind, id) -> accumulated priority of a change still waiting to be sent
+
+        # link quality and the resulting snapshot rate
+        self.rtt = None
+        self.min_rtt = None
+        self.min_interval = min_interval
+        self.max_interval = 1 / MIN_SNAPSHOT_RATE
+        self.send_interval = min_interval
+        self.next_snapshot_at = 0
+
+        # optional UDP side channel for the state updates, see udp_transport
+        self.udp_protocol = None
+        self.udp_token = None
+        self.udp = None  # (protocol, addr) once the client's hello arrived
+        self.queue = deque()  # (payload, reliable, state update seq or None)
+        self.queued_unreliable = 0
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        self.closed = False
+        self.writer_task = asyncio.create_task(self.writer())
+
+    def enqueue(self, payload, reliable=True, seq=None):
+        if self.closing or self.closed:
+            return
+        if not reliable and self.queued_unreliable:
+            # only the newest state update matters, the deltas are against the acked baseline anyway
+            self.queue = deque(item for item in self.queue if item[1])
+            self.queued_unreliable = 0
+        if len(self.queue) >= self.max_queue:
+            if self.queued_unreliable:
+                self.queue = deque(item for item in self.queue if item[1])
+                self.queued_unreliable = 0
+            elif reliable:
+                # can't drop reliable events, the client is hopelessly behind
+                print("Send queue overflow, closing connection")
+                asyncio.create_task(self.close(flush=False))
+                return
+            else:
+                return
+
+        self.queue.append((payload, reliable, seq))
+        if not reliable:
+            self.queued_unreliable += 1
+        self.wakeup.set()
+
+    def offer_udp(self, protocol):
+        """Token the client has to send over UDP before state updates switch to it."""
+        def on_ready(protocol, addr):
+            self.udp = (protocol, addr)
+            self.enqueue(self.codec.encode({"type": "udp_ready"}))
+        self.udp_protocol = protocol
+        self.udp_token = protocol.offer(on_ready)
+        return self.udp_token
+
+    def send_state(self, seq, payload):
+        """Unreliable state update: as a datagram if the side channel is up and it fits, else queued."""
+        if self.udp is not None:
+            protocol, addr = self.udp
+            data = payload.encode() if isinstance(payload, str) else payload
+            if protocol.send_snapshot(addr, seq, data):
+                return
+        self.enqueue(payload, reliable=False, seq=seq)
+
+    def last_view(self):
+        return self.views[max(self.views)] if self.views else None
+
+    def baseline(self):
+        """(seq, view) of the acked baseline, or (None, None) if a keyframe is needed."""
+        if self.acked_seq in self.views:
+            return self.acked_seq, self.views[self.acked_seq]
+        return None, None
+
+    def snapshot_due(self, now):
+        return now >= self.next_snapshot_at
+
+    def byte_budget(self):
+        return CLIENT_BYTES_PER_SECOND * self.send_interval
+
+    def record_snapshot(self, seq, view, now):
+        """now is the room's sim time, the RTT is measured on the loop clock like the acks."""
+        self.views[seq] = view
+        self.sent_at[seq] = asyncio.get_running_loop().time()
+        for old_seq in [s for s in self.views if s <= seq - SNAPSHOT_HISTORY]:
+            self.views.pop(old_seq)
+            self.sent_at.pop(old_seq)
+        self.next_snapshot_at = now + self.send_interval
+
+    def ack(self, seq, now):
+        if seq not in self.views or (self.acked_seq is not None and seq <= self.acked_seq):
+            return
+        self.acked_seq = seq
+        sample = now - self.sent_at[seq]
+        self.rtt = sample if self.rtt is None else 0.875 * self.rtt + 0.125 * sample
+        self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+
+    def adapt_rate(self):
+        """Back off quickly while updates pile up or the RTT grows, recover slowly otherwise.
+
+        Called before the next state update is queued, so anything still queued is backlog.
+        """
+        backlog = len(self.queue)
+        delayed = self.rtt is not None and self.rtt > self.min_rtt + RTT_TOLERANCE
+        if backlog or delayed:
+            self.send_interval = min(self.max_interval, self.send_interval * 2)
+        else:
+            self.send_interval = max(self.min_interval, self.send_interval - self.min_interval / 4)
+
+    async def writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    if self.closing:
+                        break
+                    await self.wakeup.wait()
+                    self.wakeup.clear()
+                    continue
+                payload, reliable, seq = self.queue.popleft()
+                if not reliable:
+                    self.queued_unreliable -= 1
+                if seq in self.sent_at:
+                    self.sent_at[seq] = asyncio.get_running_loop().time()  # it may have waited behind events
+                if isinstance(payload, bytes):
+                    await self.ws.send_bytes(payload)
+                else:
+                    await self.ws.send_text(payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            pass  # socket is gone, the endpoint's receive loop handles the disconnect
+        self.closed = True
+
+    async def close(self, flush=True):
+        """Stop the writer, after sending what is still queued if flush is set."""
+        self.closing = True
+        if self.udp_protocol:
+            self.udp_protocol.forget(self.udp_token)
+            self.udp = None
+        self.wakeup.set()
+        if not flush:
+            self.writer_task.cancel()
+        try:
+            await asyncio.wait_for(self.writer_task, CLOSE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self.closed = True
+        try:
+            await self.ws.close()
+        except:
+            pass
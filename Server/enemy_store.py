@@ -0,0 +1,203 @@
+import numpy as np
+
+from sim import ZOMBIE_STATS, CULTIST_STATS, FRAME_SIZE
+
+ENEMY_STATS = {"enemies": ZOMBIE_STATS, "cultists": CULTIST_STATS}
+KIND_NAMES = tuple(ENEMY_STATS)
+KIND_CODES = {kind: code for code, kind in enumerate(KIND_NAMES)}
+INITIAL_CAPACITY = 64
+FAR_UPDATE_INTERVAL = 4  # ticks between the updates of an enemy far from every player
+
+
+class EnemyStore:
+    """Authoritative enemy state of a room, one NumPy array per field (structure of arrays).
+
+    The live enemies are always packed in slots [0, count), a removal moves the last enemy into
+    the freed slot. step() runs the AI of every enemy at once instead of one object at a time.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, far_distance=None):
+        self.count = 0
+        self.far_distance = far_distance  # px from the closest player, beyond it the enemy is updated less often
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.speed = np.zeros(capacity)
+        self.attack_damage = np.zeros(capacity, dtype=np.int32)
+        self.attack_cooldown = np.zeros(capacity)
+        self.attack_range = np.zeros(capacity)
+        self.last_attack = np.zeros(capacity)
+        self.dirty = np.zeros(capacity, dtype=bool)  # moved or damaged since the last snapshot
+        self.removed = []  # (kind, id) removed since the last snapshot
+        self.slots = {}  # (kind, id) -> slot
+
+    _fields = ("kind", "ids", "x", "y", "health", "speed", "attack_damage", "attack_cooldown",
+               "attack_range", "last_attack", "dirty")
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def _grow(self):
+        for name in self._fields:
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, kind, k, x, y):
+        if self.count == len(self.x):
+            self._grow()
+        stats = ENEMY_STATS[kind]
+        i = self.count
+        self.kind[i] = KIND_CODES[kind]
+        self.ids[i] = k
+        self.x[i] = x
+        self.y[i] = y
+        self.health[i] = stats["max_health"]
+        self.speed[i] = stats["speed"]
+        self.attack_damage[i] = stats["attack_damage"]
+        self.attack_cooldown[i] = stats["attack_cooldown"]
+        self.attack_range[i] = stats["attack_range"]
+        self.last_attack[i] = 0
+        self.dirty[i] = True
+        self.slots[(kind, k)] = i
+        self.count += 1
+
+    def remove(self, kind, k):
+        i = self.slots.pop((kind, k), None)
+        if i is None:
+            return False
+        last = self.count - 1
+        if i != last:
+            for name in self._fields:
+                array = getattr(self, name)
+                array[i] = array[last]
+            self.slots[(KIND_NAMES[self.kind[i]], int(self.ids[i]))] = i
+        self.count = last
+        self.removed.append((kind, k))
+        return True
+
+    def damage(self, kind, k, amount):
+        """Remaining health of the enemy after the hit, None if it doesn't exist."""
+        i = self.slots.get((kind, k))
+        if i is None:
+            return None
+        self.health[i] -= amount
+        self.dirty[i] = True
+        return int(self.health[i])
+
+    def slots_at(self, x, y):
+        """Slot of an enemy whose sprite box contains each point, -1 where there is none."""
+        n = self.count
+        if n == 0:
+            return np.full(len(x), -1)
+        dx = x[:, None] - self.x[None, :n]
+        dy = y[:, None] - self.y[None, :n]
+        inside = (dx >= 0) & (dx < FRAME_SIZE) & (dy >= 0) & (dy < FRAME_SIZE)
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def damage_at(self, slots, amounts):
+        """Damage by slot (repeats add up), returns (slot, kind, id) of the enemies it killed.
+
+        The killed enemies are not removed, so the slots stay valid until the caller does.
+        """
+        before = self.health[slots] > 0
+        np.subtract.at(self.health, slots, amounts)
+        self.dirty[slots] = True
+        dead = np.unique(slots[before & (self.health[slots] <= 0)])
+        return [(slot, KIND_NAMES[code], k)
+                for slot, code, k in zip(dead.tolist(), self.kind[dead].tolist(), self.ids[dead].tolist())]
+
+    def position(self, kind, k):
+        i = self.slots.get((kind, k))
+        return None if i is None else (float(self.x[i]), float(self.y[i]))
+
+    def records(self, previous=None):
+        """{kind: {id: (x, y, health)}} in plain Python types for the snapshots, and clear the dirty flags.
+
+        With the previous records only the dirty enemies get a new tuple, the others keep theirs,
+        so an unchanged enemy is the very same object from one snapshot to the next.
+        """
+        n = self.count
+        if previous is None:
+            records = {kind: {} for kind in KIND_NAMES}
+            changed = np.arange(n)
+        else:
+            records = {kind: dict(previous[kind]) for kind in KIND_NAMES}
+            for kind, k in self.removed:
+                records[kind].pop(k, None)
+            changed = np.nonzero(self.dirty[:n])[0]
+        for code, k, x, y, h in zip(self.kind[changed].tolist(), self.ids[changed].tolist(), self.x[changed].tolist(),
+                                    self.y[changed].tolist(), self.health[changed].tolist()):
+            records[KIND_NAMES[code]][k] = (x, y, h)
+        self.dirty[:n] = False
+        self.removed.clear()
+        return records
+
+    def query_radius(self, x, y, radius):
+        """{kind: ids} of the enemies within radius of (x, y)."""
+        n = self.count
+        inside = (self.x[:n] - x) ** 2 + (self.y[:n] - y) ** 2 <= radius ** 2
+        return {kind: self.ids[:n][inside & (self.kind[:n] == code)].tolist() for kind, code in KIND_CODES.items()}
+
+    def step(self, player_x, player_y, now, flow=None, tick=0, scale=1):
+        """One AI tick for every enemy: chase the nearest player, attack it when in range.
+
+        player_x / player_y are the positions of the living players. With a flow field the enemies
+        follow it and only head straight for the player once they reach its cell. scale is how many
+        base ticks this step stands for (a room on a lower tick rate). Enemies further than
+        far_distance from every player only run every FAR_UPDATE_INTERVAL ticks, spread over the
+        ticks by slot, with a step that long. Returns the damage dealt to each player this tick,
+        in the same order.
+        """
+        n = self.count
+        damage = np.zeros(len(player_x), dtype=np.int64)
+        if n == 0 or len(player_x) == 0:
+            return damage
+        px = np.asarray(player_x, dtype=float)
+        py = np.asarray(player_y, dtype=float)
+
+        # nearest player of every enemy, from the enemies x players distance matrix
+        dist_sq = (self.x[:n, None] - px[None, :]) ** 2 + (self.y[:n, None] - py[None, :]) ** 2
+        target = dist_sq.argmin(axis=1)
+        nearest_sq = dist_sq[np.arange(n), target]
+
+        # level of detail: the far away ones only every few ticks
+        steps = np.full(n, float(scale))
+        if self.far_distance is not None:
+            far = nearest_sq > self.far_distance ** 2
+            steps[far] *= FAR_UPDATE_INTERVAL
+            active = np.nonzero(~far | ((np.arange(n) + tick) % FAR_UPDATE_INTERVAL == 0))[0]
+        else:
+            active = np.arange(n)
+        target = target[active]
+        x, y = self.x[active], self.y[active]
+        tx, ty = px[target], py[target]
+        attack_range = self.attack_range[active]
+
+        # move towards the target, unless it's already in attack range
+        chasing = nearest_sq[active] > attack_range ** 2
+        step = self.speed[active] * steps[active] * chasing
+        dx, dy = np.sign(tx - x), np.sign(ty - y)
+        if flow is not None:
+            fx, fy = flow.directions(x, y)
+            on_field = (fx != 0) | (fy != 0)
+            dx = np.where(on_field, fx, dx)
+            dy = np.where(on_field, fy, dy)
+        x += dx * step
+        y += dy * step
+        self.x[active] = x
+        self.y[active] = y
+        self.dirty[active[step > 0]] = True
+
+        # attack from the new position once the cooldown has passed
+        in_range = (x - tx) ** 2 + (y - ty) ** 2 <= attack_range ** 2
+        attacking = in_range & (now - self.last_attack[active] >= self.attack_cooldown[active])
+        self.last_attack[active[attacking]] = now
+        np.add.at(damage, target[attacking], self.attack_damage[active][attacking])
+        return damage
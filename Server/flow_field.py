@@ -0,0 +1,156 @@
+import numpy as np
+
+FLOW_CELL_SIZE = 32  # px
+FLOW_PADDING = 8  # cells around the players and enemies, so small moves don't resize the grid
+
+# diagonals first, so ties go diagonally like the old step on both axes
+NEIGHBOURS = ((-1, -1), (1, -1), (-1, 1), (1, 1), (0, -1), (-1, 0), (1, 0), (0, 1))
+UNREACHABLE = np.iinfo(np.int32).max
+
+
+class FlowField:
+    """Shared pathfinding for every enemy in a room.
+
+    A multi-source BFS from the cells of all the players gives every cell of a coarse grid its
+    distance to the closest player, and each cell points to its neighbour that is one step closer.
+    Enemies only look up the direction of the cell they are in, so the cost is the size of the grid
+    per recompute, not enemies x path length. It is recomputed only when a player changes cell
+    or the grid has to grow.
+    """
+
+    def __init__(self, bounds=None, cell_size=FLOW_CELL_SIZE, padding=FLOW_PADDING):
+        self.cell_size = cell_size
+        self.padding = padding
+        # (x0, y0, x1, y1) px of the map: the grid never goes further than padding cells past it,
+        # so a player far away can't make every recompute huge. Enemies beyond that stand still.
+        self.bounds = None
+        if bounds is not None:
+            x0, y0, x1, y1 = bounds
+            self.bounds = (x0 // cell_size, y0 // cell_size, x1 // cell_size, y1 // cell_size)
+        self.blocked = set()  # (cx, cy) cells nobody can walk through, none on the current map
+        self.origin = (0, 0)  # cell at index [0, 0]
+        self.dir_x = np.zeros((0, 0), dtype=np.int8)
+        self.dir_y = np.zeros((0, 0), dtype=np.int8)
+        self.sources = None
+
+    def set_blocked(self, cells):
+        self.blocked = set(cells)
+        self.sources = None  # force a recompute
+
+    def _cells(self, x, y):
+        return (np.floor_divide(x, self.cell_size).astype(np.int64),
+                np.floor_divide(y, self.cell_size).astype(np.int64))
+
+    def _covers(self, cx, cy):
+        rows, cols = self.dir_x.shape
+        ox, oy = self.origin
+        return (cols and cx.min() >= ox and cy.min() >= oy
+                and cx.max() < ox + cols and cy.max() < oy + rows)
+
+    def update(self, player_x, player_y, enemy_x, enemy_y):
+        """Recompute the field if needed, True if it was."""
+        if len(player_x) == 0:
+            return False
+        pcx, pcy = self._cells(np.asarray(player_x, dtype=float), np.asarray(player_y, dtype=float))
+        ecx, ecy = self._cells(np.asarray(enemy_x, dtype=float), np.asarray(enemy_y, dtype=float))
+        if self.bounds is not None:
+            bx0, by0, bx1, by1 = self.bounds
+            pcx, pcy = np.clip(pcx, bx0, bx1), np.clip(pcy, by0, by1)
+            ecx, ecy = np.clip(ecx, bx0, bx1), np.clip(ecy, by0, by1)
+        cx = np.concatenate((pcx, ecx))
+        cy = np.concatenate((pcy, ecy))
+        sources = frozenset(zip(pcx.tolist(), pcy.tolist()))
+        if sources == self.sources and self._covers(cx, cy):
+            return False
+
+        ox, oy = int(cx.min()) - self.padding, int(cy.min()) - self.padding
+        cols = int(cx.max()) + self.padding + 1 - ox
+        rows = int(cy.max()) + self.padding + 1 - oy
+        self.origin = (ox, oy)
+        self.sources = sources
+        self._compute(cols, rows)
+        return True
+
+    def _bfs(self, blocked, padded_walls):
+        """Multi-source BFS, one whole wavefront per numpy pass instead of one cell per Python step."""
+        rows, cols = blocked.shape
+        ox, oy = self.origin
+        dist = np.full((rows, cols), -1, dtype=np.int64)
+        frontier = np.zeros((rows, cols), dtype=bool)
+        for cx, cy in self.sources:
+            frontier[cy - oy, cx - ox] = True
+        frontier &= ~blocked
+        dist[frontier] = 0
+        padded_frontier = np.zeros((rows + 2, cols + 2), dtype=bool)
+
+        def shifted(padded, dx, dy):
+            # [y, x] of the result is [y - dy, x - dx] of the grid, the cell a (dx, dy) step came from
+            return padded[1 - dy:rows + 1 - dy, 1 - dx:cols + 1 - dx]
+
+        d = 0
+        while frontier.any():
+            d += 1
+            padded_frontier[1:-1, 1:-1] = frontier
+            reached = np.zeros((rows, cols), dtype=bool)
+            for dx, dy in NEIGHBOURS:
+                step = shifted(padded_frontier, dx, dy)
+                if dx and dy:
+                    # no cutting through the corner of a wall
+                    step = step & ~(shifted(padded_walls, 0, dy) | shifted(padded_walls, dx, 0))
+                reached |= step
+            frontier = reached & (dist == -1) & ~blocked
+            dist[frontier] = d
+        return dist
+
+    def _compute(self, cols, rows):
+        ox, oy = self.origin
+        blocked = np.zeros((rows, cols), dtype=bool)
+        for cx, cy in self.blocked:
+            if ox <= cx < ox + cols and oy <= cy < oy + rows:
+                blocked[cy - oy, cx - ox] = True
+
+        padded_walls = np.ones((rows + 2, cols + 2), dtype=bool)
+        padded_walls[1:-1, 1:-1] = blocked
+        if blocked.any():
+            dist = self._bfs(blocked, padded_walls)
+        else:
+            # no walls in the way: the BFS distance is the number of king moves to the closest player
+            ys, xs = np.ogrid[oy:oy + rows, ox:ox + cols]
+            dist = np.full((rows, cols), UNREACHABLE, dtype=np.int64)
+            for cx, cy in self.sources:
+                np.minimum(dist, np.maximum(abs(xs - cx), abs(ys - cy)), out=dist)
+
+        # every cell points to its closest neighbour, if that one is closer to a player
+        grid = dist
+        grid[grid < 0] = UNREACHABLE
+        padded = np.full((rows + 2, cols + 2), UNREACHABLE, dtype=np.int64)
+        padded[1:-1, 1:-1] = grid
+        candidates = []
+        for dx, dy in NEIGHBOURS:
+            neighbour = padded[1 + dy:rows + 1 + dy, 1 + dx:cols + 1 + dx].copy()
+            if dx and dy:
+                corner = (padded_walls[1:rows + 1, 1 + dx:cols + 1 + dx]
+                          | padded_walls[1 + dy:rows + 1 + dy, 1:cols + 1])
+                neighbour[corner] = UNREACHABLE
+            candidates.append(neighbour)
+        candidates = np.stack(candidates)
+        best = candidates.argmin(axis=0)
+        downhill = candidates.min(axis=0) < grid
+        offsets = np.array(NEIGHBOURS, dtype=np.int8)
+        self.dir_x = np.where(downhill, offsets[best, 0], 0).astype(np.int8)
+        self.dir_y = np.where(downhill, offsets[best, 1], 0).astype(np.int8)
+
+    def directions(self, x, y):
+        """(dx, dy) in -1 / 0 / 1 for every position, 0 in a player's cell or off the grid."""
+        rows, cols = self.dir_x.shape
+        dx = np.zeros(len(x), dtype=np.int8)
+        dy = np.zeros(len(x), dtype=np.int8)
+        if not cols:
+            return dx, dy
+        cx, cy = self._cells(x, y)
+        cx = cx - self.origin[0]
+        cy = cy - self.origin[1]
+        inside = (cx >= 0) & (cy >= 0) & (cx < cols) & (cy < rows)
+        dx[inside] = self.dir_x[cy[inside], cx[inside]]
+        dy[inside] = self.dir_y[cy[inside], cx[inside]]
+        return dx, dy
@@ -18,7 +18,7 @@ import threading
 
 # sys.path.append(r"C:\Users\USER\Desktop\IS-Python-Project")
 
-from paths import SERVER_URL, SERVER
+from paths import SERVER_URL, SERVER, WS_URL
 # SERVER_URL = "http://localhost:8000"
 # SERVER_URL = "https://88fb-2a01-5a8-307-657e-7c0b-3951-5b30-f9d4.ngrok-free.app/"
 # WS_URL = "ws://localhost:8000/ws/game"
@@ -26,15 +26,24 @@ from paths import SERVER_URL, SERVER
 # WS_URL = f"wss://usable-arachnid-crucial.ngrok-free.app/ws/game"
 
 from Entities import Player, Zombie, Cultist
-from weapons import Weapons
+from weapons import Weapons, Bow
 from UI import Inventory
 
-from GameRooms import WIDTH, HEIGHT
+from GameRooms import WIDTH, HEIGHT, MAP_BOUNDS
+from sim import FRAME_SIZE
+from connections import SNAPSHOT_HISTORY
+from snapshots import apply_state_update
+from wire import make_codec, JSON_ENCODING
+from prediction import InputPredictor
+from interpolation import ClockSync, InterpolationBuffer, INTERPOLATION_DELAY
+from udp_transport import SnapshotClientProtocol
 from Entities import INITIAL_PLAYER_SPRITE_PATH, OTHER_PLAYER_1_SPRITE_PATH, OTHER_PLAYER_2_SPRITE_PATH
 camera_x = 0
 camera_y = 0
 
 SPEED = 23
+WIRE_ENCODING = JSON_ENCODING  # wire.BINARY_ENCODING for the packed format
+USE_UDP = False  # ask for the UDP side channel for state updates (the server needs GAME_UDP_PORT)
 
 
 class GameClient:
@@ -43,6 +52,13 @@ class GameClient:
         self.room_id = None
         self.wallet = None
         self.ws = None
+        self.codec = make_codec(WIRE_ENCODING)
+        self.input_seq = 0                          # seq of the last move sent, the server echoes the last one it applied
+        self.swing_seq = 0                          # seq of the last sword swing, echoed in its swing_result
+        self.arrows = {}                            # arrow id -> (server t, x, y, vx, vy) from its spawn event
+        self.predictor = InputPredictor()           # moves not yet applied by the server
+        self.clock = ClockSync()                    # server time estimate from the state update timestamps
+        self.interpolation = InterpolationBuffer()  # recent positions of the remote entities
         self.running = False
         self.game_started = False
         self.players_coord = {}  # {'dfdc056a-fd13-4bc2-9271-cbde55c28c21': {'x': 400, 'y': 100}}
@@ -52,6 +68,9 @@ class GameClient:
         self.players = {}
         self.enemies = {}
         self.cultists = {}
+        self.snapshots = {}                         # seq -> applied state, baselines for the server deltas
+        self.last_state_seq = -1                    # newest state update applied, older ones arriving late are dropped
+        self.udp = None                             # SnapshotClientProtocol once the server offered the side channel
 
         self.weapons = None
         self.inventory = None
@@ -63,17 +82,35 @@ class GameClient:
         print("Join response text:", response.text)
         self.player_id = data["player_id"]
         self.room_id = data["room_id"]
+        # behind the shard router the room lives on one of the shard servers
+        ws_url = data.get("ws_url") or WS_URL
 
         # Step 2: Connect to WebSocket
-        self.ws = await websockets.connect(f"{WS_URL}/{self.room_id}/{self.player_id}")
+        self.ws = await websockets.connect(f"{ws_url}/{self.room_id}/{self.player_id}?encoding={self.codec.name}")
+        if USE_UDP:
+            await self.ws.send(self.codec.encode({"type": "udp_request"}))
         print(f"Connected to room {self.room_id} as {self.player_id}")
 
+    async def reconnect(self, ws_url):
+        """The server handed our room to another one, same room and player id over there."""
+        await self.ws.close()
+        if self.udp:
+            self.udp.close()
+            self.udp = None
+        # new connection, the first update is a keyframe and the old baselines are gone
+        self.snapshots = {}
+        self.last_state_seq = -1
+        self.ws = await websockets.connect(f"{ws_url}/{self.room_id}/{self.player_id}?encoding={self.codec.name}")
+        if USE_UDP:
+            await self.ws.send(self.codec.encode({"type": "udp_request"}))
+        print(f"Room {self.room_id} moved to {ws_url}")
+
     async def receive_message(self):
         while self.running:
             try:
                 async for message in self.ws:
                     print("Received message:", message)
-                    data = json.loads(message)
+                    data = self.codec.decode(message)
                     # if data["type"] == "start_game":
                     #     self.players_coord = data["players"]
                     #     self.enemies_coord = data["enemies"]
@@ -120,7 +157,9 @@ class GameClient:
 
     async def send_movements(self, dx, dy):
         try:
-            msg = json.dumps({"type": "move", "dx": dx, "dy": dy})
+            self.input_seq += 1
+            self.predictor.record(self.input_seq, dx, dy)
+            msg = self.codec.encode({"type": "move", "seq": self.input_seq, "dx": dx, "dy": dy})
             await self.ws.send(msg)
             await asyncio.sleep(0.2)
         except websockets.exceptions.ConnectionClosed:
@@ -132,9 +171,10 @@ class GameClient:
         while True:
             mes = await self.ws.recv()
             print("Received message:", mes)
-            data = json.loads(mes)
+            data = self.codec.decode(mes)
 
             if data["type"] == "start_game":
+                self.codec.set_handles(data["handles"])
                 self.players_coord = data["players"]
                 self.enemies_coord = data["enemies"]
                 self.cultists_coord = data["cultists"]
@@ -148,7 +188,7 @@ class GameClient:
     async def get_wallet_address(self):
         # Step 1: Start WebSocket to wait for wallet
         session_id = str(uuid.uuid4())
-        ws_url = f"{WS_URL}/ws/wallet_wait/{session_id}"
+        ws_url = f"wss://{SERVER}/ws/wallet_wait/{session_id}"
         print(f"Connecting to WebSocket: {ws_url}")
         async with websockets.connect(ws_url) as websocket:
             # Step 2: Open MetaMask login page in browser
@@ -173,34 +213,78 @@ class GameClient:
             if pl_id == self.player_id:
                 self.player = Player(x=x, y=y, speed=SPEED, sprite_path=INITIAL_PLAYER_SPRITE_PATH)
             else:
-                self.players[pl_id] = Player(x=x, y=y, speed=SPEED, sprite_path=OTHER_PLAYER_1_SPRITE_PATH)  # Treat as NPCs
+                self.spawn_entity("players", pl_id, prop)
 
         for e in self.enemies_coord:
-            e_id, x, y = e["id"], e["x"], e["y"]
-            self.enemies[e_id] = (Zombie(x=x, y=y))
+            self.spawn_entity("enemies", e["id"], e)
 
         for e in self.cultists_coord:
-            c_id, x, y = e["id"], e["x"], e["y"]
-            self.cultists[c_id] = (Cultist(x=x, y=y))
+            self.spawn_entity("cultists", e["id"], e)
 
         self.weapons = Weapons(player_width=self.player.width, player_height=self.player.height)
         self.inventory = Inventory(screen_width=WIDTH, screen_height=HEIGHT)
 
-    async def send_damaged_enemies(self, output):
-        enemies_taken_damage, cultists_taken_damage = output
-        e, c = [], []
-        if enemies_taken_damage:
-            e = [{"id": enemy_id, "damage": damage} for enemy_id, damage in enemies_taken_damage]
-        if cultists_taken_damage:
-            c = [{"id": enemy_id, "damage": damage} for enemy_id, damage in cultists_taken_damage]
+    def spawn_entity(self, kind, k, prop):
+        """Create the sprite of an entity that entered our area of interest."""
+        x, y = prop.get("x", 0), prop.get("y", 0)
+        if kind == "players":
+            if k != self.player_id:
+                self.players[k] = Player(x=x, y=y, speed=SPEED, sprite_path=OTHER_PLAYER_1_SPRITE_PATH)  # Treat as NPCs
+        elif kind == "enemies":
+            self.enemies[k] = Zombie(x=x, y=y)
+        else:
+            self.cultists[k] = Cultist(x=x, y=y)
+
+    def reconcile_player(self, data, state):
+        """Put the local player at the server position plus the moves it hasn't applied yet."""
+        own = state["players"].get(self.player_id)
+        if self.player is None or own is None:
+            return
+        x, y = self.predictor.reconcile(own["x"], own["y"], data.get("input_seq"))
+        # the server keeps the player on the map, the replayed moves mustn't push it off again
+        x0, y0, x1, y1 = MAP_BOUNDS
+        self.player.x = max(x0, min(x1 - FRAME_SIZE, x))
+        self.player.y = max(y0, min(y1 - FRAME_SIZE, y))
+
+    def track_interest(self, state):
+        """Create / drop sprites so they match the entities of the fully applied state.
+
+        Not from the enter / leave lists: those are relative to the acked baseline, so an entity
+        that left in one update can come back unchanged in the next (still against the old
+        baseline) with no enter for it.
+        """
+        if self.player is None:
+            return  # not drawing yet, initialize_entities will build everything
+        sprites = {"players": self.players, "enemies": self.enemies, "cultists": self.cultists}
+        for kind, entities in sprites.items():
+            for k in [k for k in entities if k not in state[kind]]:
+                entities.pop(k)
+            for k, prop in state[kind].items():
+                if k not in entities:
+                    self.spawn_entity(kind, k, prop)
+
+    async def send_shot(self, dx, dy):
+        try:
+            await self.ws.send(self.codec.encode({"type": "shoot", "dx": dx, "dy": dy}))
+        except websockets.exceptions.ConnectionClosed:
+            print("Connection closed (send)")
+            self.running = False
+            self.game_started = False
+
+    async def send_swing(self):
+        """One message per sword swing, the server works out what it hits."""
+        self.swing_seq += 1
+        # the server rewinds the enemies to what we are showing, see draw_entities
+        server_now = self.clock.server_time(asyncio.get_event_loop().time())
+        view_time = server_now - INTERPOLATION_DELAY if server_now is not None else None
         try:
-            msg = json.dumps({
-                "type": "damaged_enemies",
-                "enemies": e,
-                "cultists": c
+            msg = self.codec.encode({
+                "type": "swing",
+                "seq": self.swing_seq,
+                "facing_left": self.player.facing_left,
+                "view_time": view_time
             })
             await self.ws.send(msg)
-        # await asyncio.sleep(0.2)
         except websockets.exceptions.ConnectionClosed:
             print("Connection closed (send)")
             self.running = False
@@ -208,19 +292,21 @@ class GameClient:
 
     async def draw_entities(self, window, dt):
 
+        # remote entities are drawn slightly in the past, between two received positions
+        server_now = self.clock.server_time(asyncio.get_event_loop().time())
+        render_t = server_now - INTERPOLATION_DELAY if server_now is not None else None
+
         self.weapons.update_position(self.player.x, self.player.y)
-        output = self.weapons.weapons[1].update_slash(dt, self.player.x, self.player.y, self.player.facing_left, self.enemies, self.cultists)
-        if output:
-            await self.send_damaged_enemies(output)
+        self.weapons.weapons[1].update_slash(dt)
 
         for pl_id, prop in self.players_coord.items():
             x, y, health = prop.get("x", 0), prop.get("y", 0), prop.get("health", 0)
             if pl_id == self.player_id:
-                self.player.x = x
-                self.player.y = y
+                # position comes from the prediction, see reconcile_player
                 self.player.current_health = health
                 self.player.draw(window, camera_x, camera_y)
             else:
+                x, y = self.interpolation.sample("players", pl_id, render_t) or (x, y)
                 self.players[pl_id].x = x
                 self.players[pl_id].y = y
                 self.players[pl_id].current_health = health
@@ -228,6 +314,7 @@ class GameClient:
 
         for prop in self.enemies_coord:
             i, x, y, health = prop["id"], prop["x"], prop["y"], prop["health"]
+            x, y = self.interpolation.sample("enemies", i, render_t) or (x, y)
             self.enemies[i].x = x
             self.enemies[i].y = y
             self.enemies[i].current_health = health
@@ -236,11 +323,17 @@ class GameClient:
 
         for prop in self.cultists_coord:
             i, x, y, health = prop["id"], prop["x"], prop["y"], prop["health"]
+            x, y = self.interpolation.sample("cultists", i, render_t) or (x, y)
             self.cultists[i].x = x
             self.cultists[i].y = y
             self.cultists[i].current_health = health
             self.cultists[i].draw(window, camera_x, camera_y)
 
+        # arrows fly in a straight line from their spawn event until the server despawns them
+        for t, x, y, vx, vy in self.arrows.values():
+            flown = max(0, render_t - t) if render_t is not None else 0
+            Bow.draw_arrow(window, camera_x, camera_y, x + vx * flown, y + vy * flown, vx, vy)
+
 
     async def draw_lighting_effect(self, window):
         lighting_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
@@ -291,8 +384,14 @@ class GameClient:
                         self.inventory.select_slot(2)
 
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if self.weapons.active_weapon_index == 1:
+                    if self.weapons.active_weapon_index == 1 and not self.weapons.weapons[1].slash_active:
                         self.weapons.weapons[1].start_slash()
+                        await self.send_swing()
+                    elif self.weapons.active_weapon_index == 0 and self.weapons.weapons[0].try_shoot(pygame.time.get_ticks() / 1000):
+                        # aim from the middle of the player towards the mouse
+                        mouse_x, mouse_y = event.pos
+                        await self.send_shot(mouse_x + camera_x - (self.player.x + self.player.width / 2),
+                                             mouse_y + camera_y - (self.player.y + self.player.height / 2))
 
             keys = pygame.key.get_pressed()
 
@@ -313,8 +412,9 @@ class GameClient:
                 dy = -SPEED
             if keys[pygame.K_s]:  # Move down
                 dy = SPEED
-            #sending move coords to server
-            await self.send_movements(dx, dy)
+            #sending move coords to server, nothing to send while standing still
+            if dx or dy:
+                await self.send_movements(dx, dy)
 
             camera_x = self.player.x - WIDTH // 2
             camera_y = self.player.y - HEIGHT // 2
@@ -347,14 +447,53 @@ class GameClient:
 
         pygame.quit()
 
+    async def apply_state_update(self, data):
+        seq = data["seq"]
+        if seq <= self.last_state_seq:
+            return  # a newer one came first (over UDP)
+        state = apply_state_update(self.snapshots, data)
+        if state is None:
+            return  # baseline already dropped, the server will send a keyframe
+
+        self.last_state_seq = seq
+        self.snapshots[seq] = state
+        # the server only ever moves our baseline forward
+        baseline = data["baseline"] if data["baseline"] is not None else seq
+        for old_seq in [s for s in self.snapshots if s < baseline or s <= seq - SNAPSHOT_HISTORY]:
+            self.snapshots.pop(old_seq)
+
+        self.players_coord = state["players"]
+        self.enemies_coord = list(state["enemies"].values())
+        self.cultists_coord = list(state["cultists"].values())
+        self.track_interest(state)
+        self.reconcile_player(data, state)
+        self.clock.add_sample(data["t"], asyncio.get_event_loop().time())
+        self.interpolation.push_state(data["t"], state, skip=self.player_id)
+
+        try:
+            await self.ws.send(self.codec.encode({"type": "ack", "seq": seq}))
+        except websockets.exceptions.ConnectionClosed:
+            print("Connection closed (send)")
+            self.running = False
+            self.game_started = False
+
+    async def open_udp(self, port, token):
+        def on_snapshot(payload):
+            asyncio.create_task(self.apply_state_update(self.codec.decode(payload)))
+
+        _, self.udp = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: SnapshotClientProtocol(token, on_snapshot), remote_addr=(SERVER, port))
+        asyncio.create_task(self.udp.say_hello())
+
     async def message_dispatcher(self, game_started_event):
         while True:
             try:
                 message = await self.ws.recv()
                 print(message)
-                data = json.loads(message)
+                data = self.codec.decode(message)
 
                 if data["type"] == "start_game":
+                    self.codec.set_handles(data["handles"])
                     self.players_coord = data["players"]
                     self.enemies_coord = data["enemies"]
                     self.cultists_coord = data["cultists"]
@@ -369,9 +508,30 @@ class GameClient:
                     sys.exit()
 
                 elif data["type"] == "state_update":
-                    self.players_coord = data["players"]
-                    self.enemies_coord = data["enemies"]
-                    self.cultists_coord = data["cultists"]
+                    await self.apply_state_update(data)
+
+                elif data["type"] == "arrows":
+                    for arrow_id, x, y, vx, vy in data["spawn"]:
+                        self.arrows[arrow_id] = (data["t"], x, y, vx, vy)
+                    for arrow_id in data["despawn"]:
+                        self.arrows.pop(arrow_id, None)
+
+                elif data["type"] == "swing_result":
+                    hits = len(data["enemies"]) + len(data["cultists"])
+                    print(f"Swing {data['seq']} hit {hits} enemies")
+
+                elif data["type"] == "redirect":
+                    await self.reconnect(data["ws_url"])
+
+                elif data["type"] == "udp_offer":
+                    await self.open_udp(data["port"], data["token"])
+
+                elif data["type"] == "udp_ready":
+                    self.udp.ready = True
+                    print("State updates over UDP")
+
+                elif data["type"] == "udp_unavailable":
+                    print("No UDP side channel, state updates stay on the WebSocket")
 
                 else:
                     print("Unknown message:", data)
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+
+from GameRooms import GameRoom, room_manager, scheduler, MAX_PLAYER_SPEED, INITIAL_HEALTH
+from room_manager import WAITING, RUNNING, ENDING, TIME_TO_REMOVE_ROOM
+from enemy_store import KIND_NAMES
+from sim import SimPlayer
+from snapshots import take_snapshot
+
+# deploys: the new server listens on GAME_HANDOFF_SOCKET, the old one is told to POST /drain with
+# that socket and the new websocket url; every room is sent over, resumed there, and its players
+# get a redirect. Worker simulated rooms aren't handed off, they finish on the old server.
+HANDOFF_SOCKET = os.environ.get("GAME_HANDOFF_SOCKET")
+RECONNECT_TIMEOUT = 10  # seconds a handed off room waits for its first player before it is dropped
+
+
+def serialize_room(room, now):
+    """The room as one JSON line. Times are relative to now, so the two processes' clocks don't matter.
+
+    Arrows and sword swings in flight are left out, they are over in well under a second.
+    """
+    data = {"room_id": room.room_id, "running": room.running}
+    if not room.running:
+        # nobody has a position yet, the players just connect to the new server
+        data["taken"] = room_manager.taken.get(room.room_id, len(room.players))
+        return (json.dumps(data, separators=(",", ":")) + "\n").encode()
+
+    store = room.enemy_store
+    n = store.count
+    director = room.director
+    data.update({
+        "tick": room.tick,
+        "snapshot_seq": room.snapshot_seq,
+        "elapsed": now - room.started_at,
+        "handles": room.player_handles,
+        "players": [[pid, p.x, p.y, p.current_health, room.last_input_seq.get(pid),
+                     now - room.last_shot_at[pid] if pid in room.last_shot_at else None]
+                    for pid, p in room.state.items()],
+        "enemies": [store.kind[:n].tolist(), store.ids[:n].tolist(), store.x[:n].tolist(), store.y[:n].tolist(),
+                    store.health[:n].tolist(), (now - store.last_attack[:n]).tolist()],
+        "director": {"cursor": director.cursor, "wave_size": director.wave_size, "waves_left": director.waves_left,
+                     "next_wave_in": None if director.next_wave_at is None else director.next_wave_at - now,
+                     "pending": list(director.pending), "next_id": director.next_id, "wave": director.wave},
+    })
+    return (json.dumps(data, separators=(",", ":")) + "\n").encode()
+
+
+def restore_room(line, now):
+    """Rebuild a room from serialize_room's line and register it, the players reconnect to it."""
+    data = json.loads(line)
+    room = GameRoom(data["room_id"])
+    if not data["running"]:
+        room_manager.adopt(room, WAITING, data["taken"])
+        return room
+
+    room.running = True
+    room.tick = data["tick"]
+    room.snapshot_seq = data["snapshot_seq"]
+    room.started_at = now - data["elapsed"]
+    room.sim_time = room.last_input_at = now
+    room.player_handles = data["handles"]
+    for pid, x, y, health, input_seq, since_shot in data["players"]:
+        room.state[pid] = SimPlayer(x, y, MAX_PLAYER_SPEED, INITIAL_HEALTH)
+        room.state[pid].current_health = health
+        room.player_grid.insert(pid, x, y)
+        if input_seq is not None:
+            room.last_input_seq[pid] = input_seq
+        if since_shot is not None:
+            room.last_shot_at[pid] = now - since_shot
+
+    store = room.enemy_store
+    for code, k, x, y, health, since_attack in zip(*data["enemies"]):
+        store.add(KIND_NAMES[code], k, x, y)
+        i = store.count - 1
+        store.health[i] = health
+        store.last_attack[i] = now - since_attack
+
+    director = room.director
+    saved = data["director"]
+    director.cursor = saved["cursor"]
+    director.wave_size = saved["wave_size"]
+    director.waves_left = saved["waves_left"]
+    director.next_wave_at = None if saved["next_wave_in"] is None else now + saved["next_wave_in"]
+    director.pending.extend(saved["pending"])
+    director.next_id = saved["next_id"]
+    director.wave = saved["wave"]
+
+    room.last_snapshot = take_snapshot(room.state, store)
+    room_manager.adopt(room, RUNNING, max(0, TIME_TO_REMOVE_ROOM - data["elapsed"]))
+    asyncio.get_running_loop().call_later(RECONNECT_TIMEOUT, drop_if_abandoned, room)
+    return room
+
+
+def drop_if_abandoned(room):
+    if not room.players and room.slot is None and room_manager.get(room.room_id) is room:
+        print(f"Nobody came back to room {room.room_id}")
+        room_manager.remove(room)
+
+
+async def serve_handoffs(path):
+    """Take the rooms of a draining server on a unix socket, one JSON line per room, answered with ok."""
+    async def on_connection(reader, writer):
+        loop = asyncio.get_running_loop()
+        while line := await reader.readline():
+            try:
+                restore_room(line, loop.time())
+                writer.write(b"ok\n")
+            except Exception as e:
+                print("Handoff error:", e)
+                writer.write(b"error\n")
+            await writer.drain()
+        writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)  # left over from the previous server on this path
+    return await asyncio.start_unix_server(on_connection, path)
+
+
+class HandoffFailed(Exception):
+    """The new server went away in the middle of a handoff, after `moved` rooms."""
+
+    def __init__(self, moved, error):
+        super().__init__(f"{error!r} after {moved} rooms were handed off")
+        self.moved = moved
+
+
+async def hand_off(path, ws_url):
+    """Drain this server: no new rooms, every room goes to the server on path. Returns how many went.
+
+    If a room can't be handed off the server stops draining and keeps the rooms left, raises
+    HandoffFailed if the connection broke (the rooms moved before that are still redirected).
+    """
+    # only drain once the new server is there, a failed deploy leaves this one taking players
+    reader, writer = await asyncio.open_unix_connection(path)
+    room_manager.draining = True
+    loop = asyncio.get_running_loop()
+    moved = 0
+    all_moved = False
+    kept = 0  # rooms the new server didn't take
+    try:
+        for room in list(room_manager.rooms.values()):
+            if room.worker or room_manager.state_of.get(room.room_id) in (None, ENDING):
+                continue
+            # no tick between the copy and the redirect, or the players would lose it
+            scheduler.remove(room)
+            try:
+                writer.write(serialize_room(room, loop.time()))
+                await writer.drain()
+                reply = await reader.readline()
+                if not reply:
+                    raise ConnectionResetError("the new server closed the handoff socket")
+            except Exception as e:
+                if room.running:
+                    scheduler.add(room)  # stays here, like the rooms after it
+                raise HandoffFailed(moved, e) from e
+            if reply.strip() != b"ok":
+                if room.running:
+                    scheduler.add(room)  # stays here
+                kept += 1
+                continue
+            room.redirect(ws_url)
+            moved += 1
+        all_moved = not kept
+    finally:
+        if not all_moved:
+            room_manager.draining = False  # some rooms are still here, keep serving joins
+        writer.close()
+    return moved
@@ -0,0 +1,54 @@
+class StateHistory:
+    """Fixed-size ring buffer of the last ticks' snapshots, for lag-compensated hit checks.
+
+    The snapshots are the ones the room already takes for its state updates
+    ({kind: {id: (x, y, health)}}), so recording a tick doesn't copy anything.
+    Lookups are a binary search over the ring, never a scan of the whole history.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.times = [0.0] * size
+        self.snapshots = [None] * size
+        self.head = 0   # next slot to write
+        self.count = 0
+
+    def record(self, t, snapshot):
+        self.times[self.head] = t
+        self.snapshots[self.head] = snapshot
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def _slot(self, i):
+        """Physical slot of the i-th oldest recorded tick."""
+        return (self.head - self.count + i) % self.size
+
+    def position_at(self, kind, k, t):
+        """(x, y) of an entity at time t, interpolated between the two surrounding ticks.
+
+        t is clamped to the recorded window; None if the entity isn't in it.
+        """
+        if not self.count:
+            return None
+        lo, hi = 0, self.count - 1
+        if t >= self.times[self._slot(hi)]:
+            lo = hi
+        elif t <= self.times[self._slot(0)]:
+            hi = 0
+        else:
+            # last tick at or before t
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if self.times[self._slot(mid)] <= t:
+                    lo = mid
+                else:
+                    hi = mid
+
+        before = self.snapshots[self._slot(lo)][kind].get(k)
+        after = self.snapshots[self._slot(hi)][kind].get(k)
+        if before is None or after is None or lo == hi:
+            rec = before or after
+            return None if rec is None else (rec[0], rec[1])
+        t0, t1 = self.times[self._slot(lo)], self.times[self._slot(hi)]
+        f = (t - t0) / (t1 - t0) if t1 > t0 else 0
+        return before[0] + (after[0] - before[0]) * f, before[1] + (after[1] - before[1]) * f
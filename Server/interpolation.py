@@ -0,0 +1,69 @@
+from collections import deque
+
+INTERPOLATION_DELAY = 0.1  # remote entities are drawn this many seconds in the past
+CLOCK_SAMPLES = 32  # state updates used for the clock offset estimate
+BUFFER_SIZE = 8  # positions kept per remote entity
+
+
+class ClockSync:
+    """Estimates server time from the timestamps on the state updates.
+
+    Every update gives server_t - local receive time, which is the clock offset minus the
+    one-way delay. The largest recent sample is the one that was delayed the least, so it is
+    the best estimate of the offset; the window lets it follow route changes.
+    """
+
+    def __init__(self, samples=CLOCK_SAMPLES):
+        self.samples = deque(maxlen=samples)
+        self.offset = None
+
+    def add_sample(self, server_t, local_t):
+        self.samples.append(server_t - local_t)
+        self.offset = max(self.samples)
+
+    def server_time(self, local_t):
+        return None if self.offset is None else local_t + self.offset
+
+
+class InterpolationBuffer:
+    """Jitter buffer of timestamped positions per remote entity."""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self.positions = {}  # (kind, id) -> deque of (server_t, x, y)
+
+    def push_state(self, server_t, state, skip=None):
+        """Record every entity of the state at server_t and forget the ones that are gone.
+
+        Unchanged entities are recorded too, otherwise a stop followed by a move would be
+        smeared over the whole pause. skip is the local player, which is predicted instead.
+        """
+        seen = set()
+        for kind, records in state.items():
+            for k, rec in records.items():
+                if kind == "players" and k == skip:
+                    continue
+                key = (kind, k)
+                seen.add(key)
+                samples = self.positions.get(key)
+                if samples is None:
+                    samples = self.positions[key] = deque(maxlen=self.size)
+                if not samples or server_t > samples[-1][0]:
+                    samples.append((server_t, rec["x"], rec["y"]))
+        for key in [key for key in self.positions if key not in seen]:
+            self.positions.pop(key)
+
+    def sample(self, kind, k, render_t):
+        """Position at render_t, clamped to the oldest / newest known position."""
+        samples = self.positions.get((kind, k))
+        if not samples:
+            return None
+        if render_t is None or render_t >= samples[-1][0]:
+            return samples[-1][1], samples[-1][2]
+        if render_t <= samples[0][0]:
+            return samples[0][1], samples[0][2]
+        for (t0, x0, y0), (t1, x1, y1) in zip(samples, list(samples)[1:]):
+            if t0 <= render_t <= t1:
+                f = (render_t - t0) / (t1 - t0)
+                return x0 + (x1 - x0) * f, y0 + (y1 - y0) * f
+        return samples[-1][1], samples[-1][2]
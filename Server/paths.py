@@ -1,72 +1,129 @@
-import time
-
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import HTMLResponse, PlainTextResponse
 import os
 # pip install "uvicorn[standard]" the public server
 # uvicorn paths:app --reload
-from pydantic import BaseModel      # for validating and parsing data
 from fastapi import WebSocket, WebSocketDisconnect
-from GameRooms import GameRoom, rooms, PLAYERS_IN_ROOM
+from GameRooms import room_manager, worker_pool, scheduler, MAX_INPUT_STEP
+from wire import make_codec
+from udp_transport import SnapshotServerProtocol
+from handoff import HANDOFF_SOCKET, serve_handoffs, hand_off, HandoffFailed
 import uuid
 # uuid.uuid4() generates a universally unique identifier (UUID)
 import asyncio
+import math
 
 from contextlib import asynccontextmanager
 # app = FastAPI()
 
-TIME_TO_REMOVE_ROOM = 3000
 # SERVER_URL = "http://localhost:8000"
 SERVER_URL = " https://usable-arachnid-crucial.ngrok-free.app"
 SERVER = "usable-arachnid-crucial.ngrok-free.app"
+WS_URL = f"wss://{SERVER}/ws/game"  # the game websocket, unless /join gives the one of a shard
 TEMP_WALLET_FILE = 'wallet.txt'
-
-# system-level concerns
-async def cleanup_rooms():
-    while True:
-        await asyncio.sleep(60) # 60s
-        time_now = time.time()
-        for id in rooms:
-            if ((rooms[id].started_at and (time_now - rooms[id].started_at > TIME_TO_REMOVE_ROOM)) or
-                    (rooms[id].started_at is None and (not rooms[id].players))):
-                async with rooms[id].lock:
-                    await rooms[id].shutdown()
-                rooms.pop(id, None)
-
-
-# @app.on_event("startup")
-# async def startup_event():
-#     asyncio.create_task(cleanup_rooms())
+# optional UDP side channel for the state updates, off unless a port is given
+UDP_PORT = int(os.environ.get("GAME_UDP_PORT", "0"))
+UDP_LOSS_RATE = float(os.environ.get("GAME_UDP_LOSS_RATE", "0"))  # induced loss, for testing
+udp_server = None
+shard_link = None  # sharding.ShardLink when this server runs as one shard behind the router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global udp_server
     # Startup code
-    task = asyncio.create_task(cleanup_rooms())
+    room_manager.start()  # closes the rooms whose time is up, see RoomManager.run
+    if shard_link:
+        shard_link.start()
+    worker_pool.start()  # only starts processes if GAME_SIM_WORKERS is set
+    handoff_server = None
+    if HANDOFF_SOCKET:
+        handoff_server = await serve_handoffs(HANDOFF_SOCKET)  # rooms from a server being replaced
+    udp_transport = None
+    if UDP_PORT:
+        udp_transport, udp_server = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: SnapshotServerProtocol(UDP_LOSS_RATE), local_addr=("0.0.0.0", UDP_PORT))
 
     yield  # Everything before this runs at startup; everything after is on shutdown
 
     # Shutdown code (optional)
-    task.cancel()  # Stop the task when app shuts down
+    room_manager.stop()  # Stop the task when app shuts down
+    if shard_link:
+        shard_link.stop()
+    worker_pool.stop()
+    if handoff_server:
+        handoff_server.close()
+    if udp_transport:
+        udp_transport.close()
 app = FastAPI(lifespan=lifespan)
 
 # returns the room_id
 @app.post("/join")
 async def join_player():
     player_id = str(uuid.uuid4())
-    for rid in rooms:
-        if len(rooms[rid].players) < PLAYERS_IN_ROOM and rooms[rid].running == False:
-            print("len rooms ", len(rooms))
-            return {"room_id": rid, "player_id": player_id}
+    rid = await room_manager.join(lambda: str(uuid.uuid4()))
+    if rid is None:
+        raise HTTPException(status_code=503, detail="Server is draining")
+    print("len rooms ", len(room_manager))
+    return {"room_id": rid, "player_id": player_id}
+
+
+# rooms per lifecycle state, e.g. {"waiting": 3, "running": 120, "ending": 0}
+@app.get("/rooms")
+async def room_counts():
+    return room_manager.counts()
+
+
+# is the tick keeping up: scheduler wake-ups a whole tick late, and the ticks the rooms still up
+# simulated late (caught up) or dropped (too far behind)
+@app.get("/ticks")
+async def tick_counts():
+    rooms = list(room_manager.rooms.values())
+    return {"overruns": scheduler.overruns, "scheduled_rooms": len(scheduler),
+            "late_ticks": sum(room.late_ticks for room in rooms),
+            "skipped_ticks": sum(room.skipped_ticks for room in rooms)}
+
+
+async def receive_data(websocket: WebSocket, codec):
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    try:
+        if message.get("bytes") is not None:
+            return codec.decode(message["bytes"])
+        return codec.decode(message["text"])
+    except Exception as e:
+        # bad JSON, a short or unknown binary frame, text on a binary connection...: the frame is dropped
+        print("Undecodable message:", repr(e))
+        return None
 
-    new_rid = str(uuid.uuid4())
-    rooms[new_rid] = GameRoom(new_rid)
-    print("len rooms ", len(rooms))
-    return {"room_id": new_rid, "player_id": player_id}
 
+MAX_SEQ = 2 ** 63 - 1  # seqs are int64 in the binary format and the worker input queues
 
+
+def read_number(value, limit=None):
+    """value as a finite float, clamped to [-limit, limit]; None if it isn't a number."""
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value):
+        return None
+    return value if limit is None else max(-limit, min(limit, value))
+
+
+def read_seq(value):
+    """value if it is an int that fits the wire format and the worker queues (int64, not negative), None otherwise."""
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_SEQ:
+        return value
+    return None
+
+
+# ?encoding=binary switches the connection to the packed wire format, json is the default
 @app.websocket("/ws/game/{room_id}/{player_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str):
-    room = rooms.get(room_id)
+async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str, encoding: str = "json"):
+    room = room_manager.get(room_id)
     print(room)
     if not room or (player_id in room.players):
         await websocket.close(code=1003) # “Unsupported Data” / “Invalid Room”
@@ -75,42 +132,71 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str)
     await websocket.accept()
     print(f"Player {player_id} joined room {room_id}, room object: {room}")
 
-    await room.add_player(player_id, websocket)
+    codec = make_codec(encoding)
+    if room.running and player_id in room.state:
+        room.reconnect_player(player_id, websocket, codec)  # redirected here with its room
+    else:
+        await room.add_player(player_id, websocket, codec)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_data(websocket, codec)
             print("Recieved data: ", data, "\n")
-            if data["type"] == "move":
-                dx = data.get("dx", 0)
-                dy = data.get("dy", 0)
-                async with room.lock:
-                    player = room.state.get(player_id)
-                    if player:
-                        player["x"] += dx
-                        player["y"] += dy
-            elif data["type"] == "damaged_enemies":
-                async with room.lock:
-                    if data["enemies"]:
-                        for enemy in data["enemies"]:
-                            e_id, damage = enemy["id"], enemy["damage"]
-                            room.enemies[e_id].current_health -= damage
-                            if room.enemies[e_id].current_health <= 0:
-                                # remove enemy -> killed
-                                await room.remove_enemy(e_id, player_id)
-
-                    if data["cultists"]:
-                        for cultists in data["cultists"]:
-                            e_id, damage = cultists["id"], cultists["damage"]
-                            room.cultists[e_id].current_health -= damage
-                            if room.cultists[e_id].current_health <= 0:
-                                # remove cultists -> killed
-                                await room.remove_cultist(e_id, player_id)
+            if not isinstance(data, dict):
+                continue
+            if data.get("type") == "move":
+                seq = read_seq(data.get("seq", 0))
+                dx = read_number(data.get("dx", 0), MAX_INPUT_STEP)
+                dy = read_number(data.get("dy", 0), MAX_INPUT_STEP)
+                if seq is None or dx is None or dy is None:
+                    continue  # malformed, dropped
+                room.queue_input(player_id, seq, dx, dy)
+            elif data.get("type") == "ack":
+                seq = read_seq(data.get("seq"))
+                if seq is not None:
+                    room.ack_snapshot(player_id, seq)
+            elif data.get("type") == "udp_request":
+                connection = room.players.get(player_id)
+                if udp_server and connection:
+                    token = connection.offer_udp(udp_server)
+                    room.send(player_id, {"type": "udp_offer", "port": UDP_PORT, "token": token})
+                else:
+                    room.send(player_id, {"type": "udp_unavailable"})
+            elif data.get("type") == "shoot":
+                dx, dy = read_number(data.get("dx")), read_number(data.get("dy"))
+                if dx is not None and dy is not None:
+                    room.queue_shot(player_id, dx, dy)  # only the direction counts, no clamp needed
+            elif data.get("type") == "swing":
+                # hits are worked out by the room on its own positions, see GameRoom.resolve_swings
+                seq = None if data.get("seq") is None else read_seq(data["seq"])
+                view_time = None if data.get("view_time") is None else read_number(data["view_time"])
+                room.queue_swing(player_id, seq, bool(data.get("facing_left")), view_time)
 
     except WebSocketDisconnect:
+        pass
+    finally:
+        # whatever ended the loop, the player mustn't stay in the room
         await room.remove_player(player_id)
 
 
+# deploys: start the new server with GAME_HANDOFF_SOCKET, then POST here on the old one
+# /drain?socket=<that path>&ws_url=ws://<new host>:<port>/ws/game
+@app.post("/drain")
+async def drain(request: Request, socket: str, ws_url: str):
+    if request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403)
+    try:
+        moved = await hand_off(socket, ws_url)
+    except HandoffFailed as e:
+        # the rooms it had already taken are redirected, the others stay here and joins are back on
+        raise HTTPException(status_code=502, detail={"error": str(e), "rooms": e.moved,
+                                                     "left": room_manager.counts()})
+    except OSError as e:
+        # nothing was handed off and the server still takes players
+        raise HTTPException(status_code=502, detail=f"Can't reach the new server: {e}")
+    return {"rooms": moved, "left": room_manager.counts(), "draining": room_manager.draining}
+
+
 active_wallet_waiters = {}
 
 @app.get("/wallet_login", response_class=HTMLResponse)
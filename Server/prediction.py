@@ -0,0 +1,30 @@
+from collections import deque
+
+PENDING_INPUTS = 128  # moves kept until the server acks them (~2s of frames at 60 fps)
+
+
+class InputPredictor:
+    """Client side prediction for the local player.
+
+    Every move is applied locally right away and kept here until a state update echoes
+    its seq as input_seq. On each authoritative update the moves the server hasn't applied
+    yet are replayed on top of the server position, so the player doesn't rubber-band by
+    a full round trip.
+    """
+
+    def __init__(self, size=PENDING_INPUTS):
+        self.pending = deque(maxlen=size)  # (seq, dx, dy), oldest first
+
+    def record(self, seq, dx, dy):
+        self.pending.append((seq, dx, dy))
+
+    def reconcile(self, server_x, server_y, acked_seq):
+        """Predicted position from the server position and the last input seq it applied."""
+        if acked_seq is not None:
+            while self.pending and self.pending[0][0] <= acked_seq:
+                self.pending.popleft()
+        x, y = server_x, server_y
+        for _, dx, dy in self.pending:
+            x += dx
+            y += dy
+        return x, y
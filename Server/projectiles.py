@@ -0,0 +1,85 @@
+import numpy as np
+
+from sim import BOW_DAMAGE, ARROW_SPEED, ARROW_TTL
+
+ARROW_CAPACITY = 1024  # arrows in flight per room, a shot is dropped when the pool is full
+
+
+class ArrowPool:
+    """Arrows in flight, in fixed-size NumPy arrays allocated once per room.
+
+    Like the EnemyStore the live arrows are packed in slots [0, count). step() moves all of them,
+    checks them against every enemy at once and packs the survivors back together.
+    Arrow ids only go up, the clients use them to match the despawn with the spawn event.
+    """
+
+    def __init__(self, capacity=ARROW_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.next_id = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.owner = np.zeros(capacity, dtype=np.int32)  # player handle of the shooter
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.ttl = np.zeros(capacity)
+        self.damage = np.zeros(capacity, dtype=np.int32)
+
+    _fields = ("ids", "owner", "x", "y", "vx", "vy", "ttl", "damage")
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, owner, x, y, dir_x, dir_y, damage=BOW_DAMAGE):
+        """Fire an arrow, returns (id, vx, vy), or None if the pool is full or there's no direction."""
+        length = (dir_x ** 2 + dir_y ** 2) ** 0.5
+        if self.count == self.capacity or not length:
+            return None
+        i = self.count
+        vx, vy = dir_x / length * ARROW_SPEED, dir_y / length * ARROW_SPEED
+        self.ids[i] = self.next_id
+        self.owner[i] = owner
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.ttl[i] = ARROW_TTL
+        self.damage[i] = damage
+        self.count += 1
+        self.next_id += 1
+        return self.next_id - 1, vx, vy
+
+    def step(self, dt, enemies):
+        """Move every arrow and hit the enemies in the way.
+
+        Returns (despawned arrow ids, [(kind, id, owner) of the enemies killed]). An arrow hits at
+        most one enemy and disappears with it; the damage of several arrows on the same enemy adds up.
+        """
+        n = self.count
+        if not n:
+            return [], []
+        x, y, ttl = self.x[:n], self.y[:n], self.ttl[:n]
+        x += self.vx[:n] * dt
+        y += self.vy[:n] * dt
+        ttl -= dt
+
+        target = enemies.slots_at(x, y)
+        hit = target >= 0
+        killed = []
+        if hit.any():
+            dead = enemies.damage_at(target[hit], self.damage[:n][hit])
+            if dead:
+                owners = dict(zip(target[hit].tolist(), self.owner[:n][hit].tolist()))
+                killed = [(kind, k, owners[slot]) for slot, kind, k in dead]
+
+        gone = hit | (ttl <= 0)
+        despawned = self.ids[:n][gone].tolist()
+        if despawned:
+            keep = ~gone
+            kept = n - len(despawned)
+            for name in self._fields:
+                array = getattr(self, name)
+                array[:kept] = array[:n][keep]
+            self.count = kept
+        return despawned, killed
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+
+WAITING = "waiting"
+RUNNING = "running"
+ENDING = "ending"
+
+WAITING_TIMEOUT = 60  # seconds a room waits for its players, extended while someone is connected
+TIME_TO_REMOVE_ROOM = 3000  # seconds a game can run before the room is closed
+
+
+class RoomManager:
+    """Every room of the server, indexed by its lifecycle state.
+
+    Matchmaking takes the oldest room of the `open` dict (waiting rooms with a free seat), so a
+    join is O(1) however many rooms there are. Seats are taken at /join, before the websocket
+    connects, so two joins never get the last seat of the same room.
+    Rooms expire through a min-heap of (deadline, room_id) served by one task that sleeps until
+    the earliest deadline. A room that changes state gets a new deadline, the old heap entry is
+    simply skipped when it comes up (it no longer matches room_deadlines).
+    """
+
+    def __init__(self, room_factory, seats):
+        self.room_factory = room_factory
+        self.seats = seats
+        self.lock = asyncio.Lock()
+        self.rooms = {}  # room_id -> room
+        self.by_state = {WAITING: {}, RUNNING: {}, ENDING: {}}  # state -> {room_id: room}
+        self.state_of = {}  # room_id -> state
+        self.open = {}  # room_id -> room, waiting rooms with a free seat, oldest first
+        self.taken = {}  # room_id -> seats given out by join
+        self.deadlines = []  # heap of (loop time, room_id)
+        self.room_deadlines = {}  # room_id -> its current deadline
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.draining = False  # handing the rooms off to a new server, no joins anymore
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def counts(self):
+        return {state: len(rooms) for state, rooms in self.by_state.items()}
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def join(self, room_id_factory):
+        """Room id with a seat for one more player, a new room if none is open. None while draining."""
+        if self.draining:
+            return None
+        async with self.lock:
+            for room_id in self.open:
+                break
+            else:
+                room_id = room_id_factory()
+                self._add(self.room_factory(room_id))
+            self.taken[room_id] += 1
+            if self.taken[room_id] >= self.seats:
+                del self.open[room_id]
+            return room_id
+
+    def _add(self, room):
+        self.rooms[room.room_id] = room
+        self.taken[room.room_id] = 0
+        self.open[room.room_id] = room
+        self._set_state(room, WAITING, WAITING_TIMEOUT)
+
+    def _set_state(self, room, state, timeout=None):
+        old = self.state_of.get(room.room_id)
+        if old:
+            self.by_state[old].pop(room.room_id, None)
+        self.by_state[state][room.room_id] = room
+        self.state_of[room.room_id] = state
+        if state != WAITING:
+            self.open.pop(room.room_id, None)
+            self.taken.pop(room.room_id, None)
+        self.room_deadlines.pop(room.room_id, None)
+        if timeout is not None:
+            self._schedule(room.room_id, timeout)
+
+    def _schedule(self, room_id, timeout):
+        deadline = asyncio.get_running_loop().time() + timeout
+        self.room_deadlines[room_id] = deadline
+        if not self.deadlines or deadline < self.deadlines[0][0]:
+            self.wakeup.set()  # the expiry task sleeps until a later deadline
+        heapq.heappush(self.deadlines, (deadline, room_id))
+
+    def adopt(self, room, state, taken_or_timeout):
+        """Take over a room handed off by another server: the seats taken if it is waiting, else its time left."""
+        self.rooms[room.room_id] = room
+        if state == WAITING:
+            self.taken[room.room_id] = taken_or_timeout
+            if taken_or_timeout < self.seats:
+                self.open[room.room_id] = room
+            self._set_state(room, WAITING, WAITING_TIMEOUT)
+        else:
+            self._set_state(room, state, taken_or_timeout)
+
+    def started(self, room):
+        if room.room_id in self.rooms:
+            self._set_state(room, RUNNING, TIME_TO_REMOVE_ROOM)
+
+    def ending(self, room):
+        if room.room_id in self.rooms:
+            self._set_state(room, ENDING)
+
+    def seat_freed(self, room):
+        """A player left a room that hasn't started, its seat goes back to matchmaking."""
+        if self.state_of.get(room.room_id) == WAITING and self.taken[room.room_id] > 0:
+            self.taken[room.room_id] -= 1
+            self.open[room.room_id] = room
+
+    def remove(self, room):
+        if self.rooms.get(room.room_id) is not room:
+            return
+        del self.rooms[room.room_id]
+        self.by_state[self.state_of.pop(room.room_id)].pop(room.room_id, None)
+        self.open.pop(room.room_id, None)
+        self.taken.pop(room.room_id, None)
+        self.room_deadlines.pop(room.room_id, None)
+
+    def expired(self, now):
+        """Pop the rooms whose deadline has passed."""
+        rooms = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, room_id = heapq.heappop(self.deadlines)
+            if self.room_deadlines.get(room_id) == deadline:
+                del self.room_deadlines[room_id]
+                rooms.append(self.rooms[room_id])
+        return rooms
+
+    async def expire(self, room):
+        state = self.state_of.get(room.room_id)
+        if state == WAITING:
+            if room.players:
+                # still someone waiting, the seats nobody used go back to matchmaking
+                self.taken[room.room_id] = len(room.players)
+                self.open[room.room_id] = room
+                self._schedule(room.room_id, WAITING_TIMEOUT)
+            else:
+                self.remove(room)
+        elif state == RUNNING:
+            await room.shutdown()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.wakeup.clear()
+            timeout = self.deadlines[0][0] - loop.time() if self.deadlines else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            for room in self.expired(loop.time()):
+                try:
+                    await self.expire(room)
+                except Exception as e:
+                    print("Room cleanup error:", e)
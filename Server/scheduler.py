@@ -0,0 +1,65 @@
+import asyncio
+
+STAGGER_SLOTS = 4  # the tick window is split in this many slots, every room steps in one of them
+MAX_CATCH_UP_TICKS = 3  # ticks a late room simulates in one go, the rest are skipped
+
+
+class TickScheduler:
+    """One task that steps every running room on a fixed timestep.
+
+    Rooms are spread over STAGGER_SLOTS slots of the tick window, so their simulation and state
+    updates don't all land at the same moment. The wake-up times are computed from the start time,
+    not from the previous sleep, so the ticks don't drift. Adding or removing a room is a dict
+    operation; the task itself only runs while there are rooms.
+    Every room keeps its own simulation clock (room.sim_time), a room that falls behind catches
+    up with up to MAX_CATCH_UP_TICKS ticks per step and skips the rest (see GameRoom.step).
+    """
+
+    def __init__(self, tick_rate, slots=STAGGER_SLOTS):
+        self.tick_rate = tick_rate
+        self.slot_interval = tick_rate / slots
+        self.slots = [{} for _ in range(slots)]  # room_id -> room
+        self.task = None
+        self.overruns = 0  # wake-ups that came more than a whole tick late
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+    def add(self, room):
+        slot = min(range(len(self.slots)), key=lambda i: len(self.slots[i]))
+        room.slot = slot
+        room.sim_time = asyncio.get_running_loop().time()
+        self.slots[slot][room.room_id] = room
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def remove(self, room):
+        slot = getattr(room, "slot", None)
+        if slot is not None:
+            self.slots[slot].pop(room.room_id, None)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        wakeups = 0
+        while len(self):
+            wakeups += 1
+            wake_at = start + wakeups * self.slot_interval
+            delay = wake_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)  # still let the sockets run
+                if -delay > self.tick_rate:
+                    # too far behind, realign instead of firing a burst of wake-ups
+                    self.overruns += 1
+                    wakeups = int((loop.time() - start) / self.slot_interval)
+
+            now = loop.time()
+            for room in list(self.slots[wakeups % len(self.slots)].values()):
+                try:
+                    room.step(now)
+                except Exception as e:
+                    print("Game loop error:", e)
+                    self.remove(room)
+                    room.end_game()  # close it for its players too, not only stop ticking it
@@ -0,0 +1,253 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import uuid
+
+from fastapi import FastAPI, Request, HTTPException
+from contextlib import asynccontextmanager
+
+# sharded mode: python sharding.py starts a router on ROUTER_PORT and GAME_SHARDS shard processes
+# on SHARD_BASE_PORT, SHARD_BASE_PORT + 1, ... Every shard is a normal paths:app server that owns
+# its rooms, the router only decides which shard a new player goes to. The shards share the
+# environment except GAME_UDP_PORT (+ shard id), GAME_HANDOFF_SOCKET (.<shard id> appended) and
+# GAME_SIM_WORKERS (split between them). tests/test_sharding.py runs one locally.
+ROUTER_PORT = int(os.environ.get("GAME_ROUTER_PORT", "8000"))
+SHARD_BASE_PORT = int(os.environ.get("GAME_SHARD_BASE_PORT", "8001"))
+SHARD_COUNT = int(os.environ.get("GAME_SHARDS", str(os.cpu_count() or 1)))
+LOAD_REPORT_INTERVAL = 1  # seconds between two load reports of a shard
+JOIN_TIMEOUT = 2  # seconds a shard gets to answer a join before it is tried on another one
+
+
+class ShardLink:
+    """A shard's end of the pipe to the router: answers the joins and reports the load.
+
+    Messages are tuples:
+      router -> shard  ("join", request)
+      shard -> router  ("joined", request, room_id, room_still_open), room_id None while draining
+                       ("load", players, {state: rooms})
+    """
+
+    def __init__(self, shard_id, connection):
+        self.shard_id = shard_id
+        self.connection = connection
+        self.task = None
+
+    def start(self):
+        asyncio.get_running_loop().add_reader(self.connection.fileno(), self.on_message)
+        self.task = asyncio.create_task(self.report_load())
+
+    def stop(self):
+        asyncio.get_running_loop().remove_reader(self.connection.fileno())
+        if self.task:
+            self.task.cancel()
+
+    def on_message(self):
+        try:
+            while self.connection.poll():
+                msg = self.connection.recv()
+                if msg[0] == "join":
+                    asyncio.create_task(self.join(msg[1]))
+        except EOFError:
+            # the router is gone, nobody will send players here anymore
+            self.stop()
+
+    async def join(self, request):
+        from GameRooms import room_manager
+        # the room id starts with the shard, so it tells which shard owns it
+        room_id = await room_manager.join(lambda: f"{self.shard_id}-{uuid.uuid4()}")
+        self.connection.send(("joined", request, room_id, room_id in room_manager.open))
+
+    async def report_load(self):
+        from GameRooms import room_manager
+        while True:
+            players = sum(len(room.players) for room in room_manager.rooms.values())
+            self.connection.send(("load", players, room_manager.counts()))
+            await asyncio.sleep(LOAD_REPORT_INTERVAL)
+
+
+def shard_environment(shard_id, shard_count):
+    """Set the settings that can't be shared by the shards, before paths is imported."""
+    udp_port = int(os.environ.get("GAME_UDP_PORT", "0"))
+    if udp_port:
+        os.environ["GAME_UDP_PORT"] = str(udp_port + shard_id)  # one UDP port per shard as well
+    handoff_socket = os.environ.get("GAME_HANDOFF_SOCKET")
+    if handoff_socket:
+        # every shard binds its own socket, the same path would be unlinked by the next shard
+        os.environ["GAME_HANDOFF_SOCKET"] = f"{handoff_socket}.{shard_id}"
+    sim_workers = int(os.environ.get("GAME_SIM_WORKERS", "0"))
+    if sim_workers:
+        # the workers are split between the shards instead of every shard starting all of them
+        os.environ["GAME_SIM_WORKERS"] = str(max(1, sim_workers // shard_count))
+
+
+def run_shard(shard_id, shard_count, port, connection):
+    """Entry point of a shard process."""
+    import uvicorn
+    shard_environment(shard_id, shard_count)
+    import paths
+    paths.shard_link = ShardLink(shard_id, connection)
+    uvicorn.run(paths.app, host="0.0.0.0", port=port, log_level="warning")
+
+
+class ShardRouter:
+    """Starts the shard processes and sends every join to one of them.
+
+    A join goes to the shard whose last room still had a free seat, so rooms fill up before new
+    ones are made, otherwise to the least loaded shard. The load is the player count of the last
+    report plus the joins sent to the shard since then. A shard that dies, is draining or doesn't
+    answer in time is skipped and the join is tried on the next one.
+    """
+
+    def __init__(self, count=SHARD_COUNT, base_port=SHARD_BASE_PORT):
+        self.ports = [base_port + i for i in range(count)]
+        self.connections = []
+        self.processes = []
+        self.players = [0] * count  # from the last load report of each shard
+        self.rooms = [{} for _ in range(count)]  # state -> rooms, from the same report
+        self.joined_since_report = [0] * count
+        self.alive = [True] * count
+        self.draining = [False] * count  # answered a join with no room, it won't take new players
+        self.open_shard = None
+        self.requests = itertools.count()
+        self.pending = {}  # request -> (shard_id, future of the shard's answer)
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+        for shard_id, port in enumerate(self.ports):
+            connection, child = context.Pipe()
+            process = context.Process(target=run_shard, args=(shard_id, len(self.ports), port, child), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+            loop.add_reader(connection.fileno(), self.on_message, shard_id)
+        print(f"{len(self.ports)} shards on ports {self.ports}")
+
+    def stop(self):
+        loop = asyncio.get_running_loop()
+        for connection, process in zip(self.connections, self.processes):
+            loop.remove_reader(connection.fileno())
+            process.terminate()
+
+    def on_message(self, shard_id):
+        connection = self.connections[shard_id]
+        try:
+            while connection.poll():
+                msg = connection.recv()
+                if msg[0] == "joined":
+                    _, future = self.pending.pop(msg[1], (None, None))
+                    if future and not future.done():
+                        future.set_result((msg[2], msg[3]))
+                elif msg[0] == "load":
+                    self.players[shard_id] = msg[1]
+                    self.rooms[shard_id] = msg[2]
+                    self.joined_since_report[shard_id] = 0
+        except EOFError:
+            self.shard_gone(shard_id)
+
+    def shard_gone(self, shard_id):
+        if not self.alive[shard_id]:
+            return
+        print(f"Shard {shard_id} is gone")
+        self.alive[shard_id] = False
+        asyncio.get_running_loop().remove_reader(self.connections[shard_id].fileno())
+        if self.open_shard == shard_id:
+            self.open_shard = None
+        # the joins it still owed an answer are tried elsewhere
+        for request, (owner, future) in list(self.pending.items()):
+            if owner == shard_id:
+                del self.pending[request]
+                if not future.done():
+                    future.set_exception(ConnectionError(f"shard {shard_id} is gone"))
+
+    def accepting(self, shard_id):
+        return self.alive[shard_id] and not self.draining[shard_id]
+
+    def least_loaded(self, skip=()):
+        shards = [i for i in range(len(self.ports)) if self.accepting(i) and i not in skip]
+        if not shards:
+            return None
+        return min(shards, key=lambda i: self.players[i] + self.joined_since_report[i])
+
+    async def join(self):
+        """(shard_id, room_id) for one more player, None if no shard can take one."""
+        tried = set()
+        while True:
+            if self.open_shard is not None and self.accepting(self.open_shard) and self.open_shard not in tried:
+                shard_id = self.open_shard
+            else:
+                shard_id = self.least_loaded(tried)
+            if shard_id is None:
+                return None
+            tried.add(shard_id)
+            request = next(self.requests)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request] = (shard_id, future)
+            try:
+                self.connections[shard_id].send(("join", request))
+                self.joined_since_report[shard_id] += 1
+                room_id, still_open = await asyncio.wait_for(future, JOIN_TIMEOUT)
+            except asyncio.TimeoutError:  # before OSError, TimeoutError is one since 3.11
+                self.pending.pop(request, None)
+                print(f"Shard {shard_id} didn't answer the join")
+                continue
+            except OSError:
+                # broken pipe, or failed by shard_gone (ConnectionError)
+                self.pending.pop(request, None)
+                self.shard_gone(shard_id)
+                continue
+            if room_id is None:
+                self.draining[shard_id] = True
+                continue
+            self.open_shard = shard_id if still_open else None
+            return shard_id, room_id
+
+    def counts(self):
+        total = {}
+        for rooms in self.rooms:
+            for state, n in rooms.items():
+                total[state] = total.get(state, 0) + n
+        return total
+
+
+router = ShardRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    router.start()
+    yield
+    router.stop()
+
+router_app = FastAPI(lifespan=lifespan)
+
+
+# same answer as paths' /join, plus the shard to open the websocket on
+@router_app.post("/join")
+async def join_player(request: Request):
+    player_id = str(uuid.uuid4())
+    joined = await router.join()
+    if joined is None:
+        raise HTTPException(status_code=503, detail="No shard can take players")
+    shard_id, room_id = joined
+    ws_url = f"ws://{request.url.hostname}:{router.ports[shard_id]}/ws/game"
+    return {"room_id": room_id, "player_id": player_id, "shard": shard_id, "ws_url": ws_url}
+
+
+@router_app.get("/rooms")
+async def room_counts():
+    return router.counts()
+
+
+@router_app.get("/shards")
+async def shard_loads():
+    return [{"shard": i, "port": port, "alive": router.alive[i],
+             "draining": router.draining[i], "players": router.players[i], "rooms": router.rooms[i]}
+            for i, port in enumerate(router.ports)]
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(router_app, host="0.0.0.0", port=ROUTER_PORT)
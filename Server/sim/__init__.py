@@ -0,0 +1,5 @@
+# Headless simulation core, plain Python only (no pygame), so the server can run without SDL.
+# The rendering classes in Entities.py wrap these.
+from sim.entities import SimEntity, SimPlayer, SimZombie, SimCultist, ZOMBIE_STATS, CULTIST_STATS, FRAME_SIZE
+from sim.melee import Swing, slash_rect, rects_overlap, SWORD_DAMAGE, SLASH_DURATION, SLASH_SIZE
+from sim.ranged import BOW_DAMAGE, BOW_RANGE, BOW_ATTACK_SPEED, ARROW_SPEED, ARROW_TTL
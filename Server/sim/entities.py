@@ -0,0 +1,101 @@
+import math
+
+FRAME_SIZE = 65  # px, one frame of the character sprite sheets
+
+# gameplay numbers of the enemies, also used by the server's EnemyStore
+ZOMBIE_STATS = {"speed": 1, "max_health": 50, "attack_damage": 10, "attack_cooldown": 1.0, "attack_range": 100}
+CULTIST_STATS = {"speed": 2, "max_health": 100, "attack_damage": 15, "attack_cooldown": 1.5, "attack_range": 120}
+
+
+class SimEntity:
+    """Position, speed and health of anything that moves around the map."""
+    __slots__ = ("x", "y", "speed", "width", "height", "max_health", "current_health", "facing_left")
+
+    def __init__(self, x, y, speed, max_health=100, scale_factor=1):
+        self.x = x
+        self.y = y
+        self.speed = speed
+        self.width = FRAME_SIZE * scale_factor
+        self.height = FRAME_SIZE * scale_factor
+        self.max_health = max_health
+        self.current_health = max_health
+        self.facing_left = False
+
+    def move(self, dx, dy):
+        self.x += dx
+        self.y += dy
+        if dx:
+            self.facing_left = dx < 0
+
+    def take_damage(self, damage):
+        """Reduce health, True if the entity died."""
+        self.current_health -= damage
+        if self.current_health <= 0:
+            self.current_health = 0
+            return True
+        return False
+
+    def get_rect(self):
+        """(x, y, width, height) of the bounding box."""
+        return self.x, self.y, self.width, self.height
+
+
+class SimPlayer(SimEntity):
+    __slots__ = ()
+
+
+class SimEnemy(SimEntity):
+    """Chases the closest player and attacks it when in range."""
+    __slots__ = ("attack_damage", "attack_cooldown", "attack_range", "last_attack_time", "original_x", "original_y")
+    stats = None
+
+    def __init__(self, x, y, speed=None, scale_factor=1):
+        stats = self.stats
+        super().__init__(x, y, stats["speed"] if speed is None else speed, stats["max_health"], scale_factor)
+        self.attack_damage = stats["attack_damage"]
+        self.attack_cooldown = stats["attack_cooldown"]  # seconds between attacks
+        self.attack_range = stats["attack_range"]
+        self.last_attack_time = 0
+        self.original_x = x  # respawn position
+        self.original_y = y
+
+    def follow_player(self, player_x, player_y):
+        """Step towards the player on each axis unless it is within attack range. True if it moved."""
+        distance = math.hypot(self.x - player_x, self.y - player_y)
+        if distance <= self.attack_range:
+            return False
+
+        dx, dy = 0, 0
+        if self.x < player_x:
+            dx = self.speed
+        elif self.x > player_x:
+            dx = -self.speed
+        if self.y < player_y:
+            dy = self.speed
+        elif self.y > player_y:
+            dy = -self.speed
+        self.move(dx, dy)
+        return True
+
+    def attack_player(self, coords, current_time):
+        """True if the player is within range and the cooldown has passed."""
+        distance = math.hypot(self.x - coords[0], self.y - coords[1])
+        if distance <= self.attack_range and current_time - self.last_attack_time >= self.attack_cooldown:
+            self.last_attack_time = current_time
+            return True
+        return False
+
+    def respawn(self):
+        self.x = self.original_x
+        self.y = self.original_y
+        self.current_health = self.max_health
+
+
+class SimZombie(SimEnemy):
+    __slots__ = ()
+    stats = ZOMBIE_STATS
+
+
+class SimCultist(SimEnemy):
+    __slots__ = ()
+    stats = CULTIST_STATS
@@ -0,0 +1,33 @@
+from sim.entities import FRAME_SIZE
+
+SLASH_DURATION = 0.2  # seconds the slash is active
+# per enemy per swing: the old client hit for 1 on every frame of the slash at 60 fps, so same tuning
+SWORD_DAMAGE = round(SLASH_DURATION * 60)
+SLASH_SIZE = 64  # px, one frame of the slash animation
+
+
+def slash_rect(player_x, player_y, facing_left, player_width=FRAME_SIZE, player_height=FRAME_SIZE):
+    """(x, y, width, height) the slash covers, in front of the player."""
+    if facing_left:
+        return player_x - player_width, player_y + player_height // 4, SLASH_SIZE, SLASH_SIZE
+    return player_x + player_width + 10, player_y + player_height // 4, SLASH_SIZE, SLASH_SIZE
+
+
+def rects_overlap(a, b):
+    """Same rule as pygame.Rect.colliderect: touching edges don't count."""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class Swing:
+    """One sword swing of a player, active for SLASH_DURATION.
+
+    Every enemy is hit at most once per swing, hit keeps the ones already hit in order.
+    """
+    __slots__ = ("seq", "facing_left", "rewind", "ends_at", "hit")
+
+    def __init__(self, seq, facing_left, rewind, started_at):
+        self.seq = seq
+        self.facing_left = facing_left
+        self.rewind = rewind  # seconds the targets are moved back, what the player saw when swinging
+        self.ends_at = started_at + SLASH_DURATION
+        self.hit = {}  # (kind, id) -> damage
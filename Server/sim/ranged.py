@@ -0,0 +1,5 @@
+BOW_DAMAGE = 15  # per arrow
+BOW_RANGE = 300  # px an arrow flies before it drops
+BOW_ATTACK_SPEED = 1.5  # shots per second
+ARROW_SPEED = 600  # px per second, about 20 px per tick so an arrow can't skip over an enemy
+ARROW_TTL = BOW_RANGE / ARROW_SPEED  # seconds in flight
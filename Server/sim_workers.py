@@ -0,0 +1,322 @@
+import asyncio
+import multiprocessing
+import os
+import platform
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from enemy_store import EnemyStore, KIND_NAMES
+
+# worker mode: GAME_SIM_WORKERS=N simulates the running rooms in N processes, the server process
+# only handles the sockets and encodes/sends what the workers publish
+SIM_WORKERS = int(os.environ.get("GAME_SIM_WORKERS", "0"))
+
+RING_SLOTS = 8  # snapshots per room ring, the reader takes the newest
+MAX_PLAYERS = 8
+MAX_ENEMIES = 1024  # per room, anything beyond isn't published
+INPUT_CAPACITY = 256  # queued inputs per room, more are dropped like a flooded input queue
+WORKER_POLL = 1 / 120  # seconds, how long a worker waits for commands between two steps
+# the rings have no lock or fence and count on x86 keeping stores in order, see InputQueue
+X86_MACHINES = ("x86_64", "amd64", "i386", "i486", "i586", "i686", "x86")
+
+PLAYER_DTYPE = np.dtype([("handle", "i4"), ("health", "i4"), ("x", "f8"), ("y", "f8"), ("input_seq", "i8")])
+ENEMY_DTYPE = np.dtype([("kind", "i1"), ("health", "i4"), ("id", "i8"), ("x", "f8"), ("y", "f8")])
+SLOT_DTYPE = np.dtype([("seq", "i8"), ("t", "f8"), ("players", "i4"), ("enemies", "i4"),
+                       ("player", PLAYER_DTYPE, (MAX_PLAYERS,)), ("enemy", ENEMY_DTYPE, (MAX_ENEMIES,))])
+RING_DTYPE = np.dtype([("latest", "i8"), ("slots", SLOT_DTYPE, (RING_SLOTS,))])
+
+INPUT_DTYPE = np.dtype([("kind", "i1"), ("handle", "i4"), ("seq", "i8"), ("a", "f8"), ("b", "f8"), ("c", "f8")])
+QUEUE_DTYPE = np.dtype([("head", "i8"), ("tail", "i8"), ("items", INPUT_DTYPE, (INPUT_CAPACITY,))])
+MOVE, SHOT, SWING = 0, 1, 2
+NO_SEQ = -1  # swing without a seq, player without an applied input
+
+
+class SharedBlock:
+    """A numpy structured scalar laid over a shared memory block, created by the server, attached by the worker."""
+
+    def __init__(self, dtype, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=dtype.itemsize)
+        else:
+            # the workers share the server's resource tracker, so the block is still only unlinked once
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.data = np.ndarray((), dtype, buffer=self.shm.buf)
+        self.views = {}
+
+    def close(self, unlink=False):
+        self.views.clear()
+        self.data = None  # no views left on the buffer, or SharedMemory.close() refuses
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SnapshotRing(SharedBlock):
+    """Fixed-layout snapshots of one room, written by its worker and read by the server.
+
+    Every slot works like a seqlock: the writer sets its seq to -1, fills it, writes the real seq
+    and then moves `latest` to it. The reader checks the seq before and after building the
+    records, a slot that was rewritten in between (the server RING_SLOTS ticks behind) is dropped.
+    No pickling and no copy of the arrays, the records are built straight from the shared memory.
+    """
+
+    def __init__(self, name=None):
+        super().__init__(RING_DTYPE, name)
+        if name is None:
+            self.data["latest"] = -1
+        slots = self.data["slots"]
+        self.views = {"seq": slots["seq"], "t": slots["t"], "players": slots["players"],
+                      "enemies": slots["enemies"], "player": slots["player"], "enemy": slots["enemy"]}
+        self.last_read = -1
+        self.torn_reads = 0
+        self.overflowed = False
+
+    def publish(self, seq, t, players, enemy_store):
+        """players is [(handle, x, y, health, last input seq)]."""
+        v = self.views
+        i = seq % RING_SLOTS
+        v["seq"][i] = -1
+        v["t"][i] = t
+        v["players"][i] = len(players)
+        slot = v["player"][i]
+        for j, (handle, x, y, health, input_seq) in enumerate(players[:MAX_PLAYERS]):
+            slot[j] = (handle, health, x, y, NO_SEQ if input_seq is None else input_seq)
+        n = min(enemy_store.count, MAX_ENEMIES)
+        if n < enemy_store.count and not self.overflowed:
+            self.overflowed = True
+            print(f"{enemy_store.count} enemies in a room, only the first {MAX_ENEMIES} are published")
+        enemies = v["enemy"][i]
+        enemies["kind"][:n] = enemy_store.kind[:n]
+        enemies["id"][:n] = enemy_store.ids[:n]
+        enemies["x"][:n] = enemy_store.x[:n]
+        enemies["y"][:n] = enemy_store.y[:n]
+        enemies["health"][:n] = enemy_store.health[:n]
+        v["enemies"][i] = n
+        v["seq"][i] = seq
+        self.data["latest"] = seq
+
+    def read(self):
+        """(seq, slot) of the newest snapshot not read yet, None if there is none."""
+        seq = int(self.data["latest"])
+        if seq <= self.last_read:
+            return None
+        i = seq % RING_SLOTS
+        if self.views["seq"][i] != seq:
+            return None  # being rewritten, the next one will do
+        self.last_read = seq
+        return seq, i
+
+    def valid(self, seq, i):
+        if self.views["seq"][i] == seq:
+            return True
+        self.torn_reads += 1
+        return False
+
+
+class SharedEnemyView:
+    """The enemies of one ring slot with the parts of the EnemyStore interface the server uses."""
+
+    query_radius = EnemyStore.query_radius
+
+    def __init__(self):
+        self.count = 0
+        self.kind = self.ids = self.x = self.y = self.health = np.zeros(0)
+
+    def __len__(self):
+        return self.count
+
+    def show(self, enemies, count):
+        self.count = count
+        self.kind, self.ids, self.x, self.y, self.health = (
+            enemies["kind"], enemies["id"], enemies["x"], enemies["y"], enemies["health"])
+
+    def records(self, previous=None):
+        """Same as EnemyStore.records, an unchanged enemy keeps the tuple of the previous snapshot."""
+        n = self.count
+        records = {kind: {} for kind in KIND_NAMES}
+        for code, k, x, y, h in zip(self.kind[:n].tolist(), self.ids[:n].tolist(), self.x[:n].tolist(),
+                                    self.y[:n].tolist(), self.health[:n].tolist()):
+            kind = KIND_NAMES[code]
+            rec = (x, y, h)
+            old = previous[kind].get(k) if previous else None
+            records[kind][k] = old if old == rec else rec
+        return records
+
+
+class InputQueue(SharedBlock):
+    """Single producer / single consumer ring of player inputs, server -> worker, no lock.
+
+    The server only ever writes tail and the worker only head, each after the items it covers,
+    so on x86 (stores aren't reordered) the consumer never sees a half written input.
+    """
+
+    def __init__(self, name=None):
+        super().__init__(QUEUE_DTYPE, name)
+        if name is None:
+            self.data["head"] = self.data["tail"] = 0
+        self.views = {"items": self.data["items"]}
+
+    def push(self, kind, handle, seq, a, b, c=0.0):
+        tail = int(self.data["tail"])
+        if tail - int(self.data["head"]) >= INPUT_CAPACITY:
+            return False
+        self.views["items"][tail % INPUT_CAPACITY] = (kind, handle, seq, a, b, c)
+        self.data["tail"] = tail + 1
+        return True
+
+    def pop_all(self):
+        head, tail = int(self.data["head"]), int(self.data["tail"])
+        items = self.views["items"]
+        inputs = [items[i % INPUT_CAPACITY].item() for i in range(head, tail)]
+        self.data["head"] = tail
+        return inputs
+
+
+class RoomLink:
+    """The server's side of a room simulated by a worker."""
+
+    def __init__(self, room, worker):
+        self.room = room
+        self.worker = worker
+        self.ring = SnapshotRing()
+        self.inputs = InputQueue()
+        self.enemies = SharedEnemyView()
+
+    def push_move(self, handle, seq, dx, dy):
+        self.inputs.push(MOVE, handle, seq, dx, dy)
+
+    def push_shot(self, handle, dx, dy):
+        self.inputs.push(SHOT, handle, 0, dx, dy)
+
+    def push_swing(self, handle, seq, facing_left, rewind):
+        self.inputs.push(SWING, handle, NO_SEQ if seq is None else seq, float(facing_left), rewind)
+
+    def read(self, previous):
+        """(t, snapshot) of the newest published tick, None if there is nothing new."""
+        found = self.ring.read()
+        if found is None:
+            return None
+        seq, i = found
+        v = self.ring.views
+        players = {h: pid for pid, h in self.room.player_handles.items()}
+        self.enemies.show(v["enemy"][i], int(v["enemies"][i]))
+        t = float(v["t"][i])
+        snapshot = self.enemies.records(previous)
+        slot = v["player"][i][:int(v["players"][i])]
+        snapshot["players"] = {}
+        input_seqs = {}
+        for h, health, x, y, input_seq in slot.tolist():
+            if h in players:
+                snapshot["players"][players[h]] = (x, y, health)
+                input_seqs[players[h]] = None if input_seq == NO_SEQ else input_seq
+        if not self.ring.valid(seq, i):
+            return None
+        self.room.last_input_seq.update(input_seqs)
+        return t, snapshot
+
+    def close(self):
+        self.enemies.show({"kind": None, "id": None, "x": None, "y": None, "health": None}, 0)  # let go of the ring
+        self.ring.close(unlink=True)
+        self.inputs.close(unlink=True)
+
+
+class WorkerPool:
+    """Worker processes that simulate the running rooms, a room stays on one worker.
+
+    Commands (new room, player left, room closed) and the room events going back (kills,
+    arrows, swing results, deaths, game over) are rare and go through a Pipe per worker; the
+    snapshots and inputs, every tick, go through the shared memory rings.
+    """
+
+    def __init__(self, count=SIM_WORKERS):
+        self.count = count
+        self.connections = []
+        self.processes = []
+        self.rooms = {}  # room_id -> GameRoom simulated by a worker
+        self.load = [0] * count
+
+    def enabled(self):
+        return bool(self.processes)
+
+    def start(self):
+        from worker_room import run_worker
+        if self.count and platform.machine().lower() not in X86_MACHINES:
+            print(f"Simulation workers need x86 (the shared memory rings aren't fenced), "
+                  f"not {platform.machine()}: rooms run in the server process")
+            self.count = 0
+            self.load = []
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+        for i in range(self.count):
+            connection, child = context.Pipe()
+            process = context.Process(target=run_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+            loop.add_reader(connection.fileno(), self.on_message, i)
+        if self.count:
+            print(f"{self.count} simulation workers")
+
+    def stop(self):
+        loop = asyncio.get_running_loop()
+        for connection, process in zip(self.connections, self.processes):
+            loop.remove_reader(connection.fileno())
+            process.terminate()
+        for room in list(self.rooms.values()):
+            room.worker.close()
+        self.rooms.clear()
+        self.processes.clear()
+
+    def attach(self, room):
+        """Hand a starting room to the least loaded worker, returns the view on its enemies."""
+        worker = min(range(self.count), key=lambda i: self.load[i])
+        room.worker = RoomLink(room, worker)
+        self.load[worker] += 1
+        self.rooms[room.room_id] = room
+        players = [(pid, room.player_handles[pid], p.x, p.y, p.current_health) for pid, p in room.state.items()]
+        self.connections[worker].send(("add_room", room.room_id, room.worker.ring.name, room.worker.inputs.name,
+                                       players))
+        return room.worker.enemies
+
+    def send(self, worker, msg):
+        try:
+            self.connections[worker].send(msg)
+        except OSError:
+            pass  # the worker died, on_message closes its rooms
+
+    def remove_player(self, room, player_id):
+        self.send(room.worker.worker, ("remove_player", room.room_id, player_id))
+
+    def detach(self, room):
+        link = room.worker
+        if self.rooms.pop(room.room_id, None) is None:
+            return
+        self.load[link.worker] -= 1
+        self.send(link.worker, ("remove_room", room.room_id))
+        room.worker = None
+        link.close()
+
+    def on_message(self, worker):
+        connection = self.connections[worker]
+        try:
+            while connection.poll():
+                msg = connection.recv()
+                room = self.rooms.get(msg[1])
+                if room is None:
+                    continue
+                if msg[0] == "send":
+                    room.send(msg[2], msg[3], msg[4])
+                elif msg[0] == "broadcast":
+                    room.broadcast(msg[2], msg[3])
+                elif msg[0] == "died":
+                    room.drop_dead_player(msg[2])
+                elif msg[0] == "ended":
+                    asyncio.create_task(room.shutdown())
+        except EOFError:
+            print(f"Simulation worker {worker} is gone")
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+            for room in [room for room in self.rooms.values() if room.worker.worker == worker]:
+                asyncio.create_task(room.shutdown())
@@ -0,0 +1,218 @@
+# Snapshot / delta compression helpers for the state_update messages.
+# Every client only sees the entities around its own player (its view). The server
+# keeps the last few views it sent to each client, the client acks the last sequence
+# it applied and gets only what changed since that baseline, with the entities that
+# entered or left its area listed explicitly. Without a (still known) baseline a
+# keyframe is sent instead. When a client's byte budget can't fit every change, the
+# ones left out stay pending and are sent by priority in later updates.
+
+ENTITY_KINDS = ("players", "enemies", "cultists")
+
+# prioritisation when not every changed entity fits the client's byte budget
+NEAR_WEIGHT = 2  # extra priority per snapshot for an entity right next to the player
+RECENT_CHANGE_WEIGHT = 1  # extra priority per snapshot for an entity that changed this tick
+
+
+def take_snapshot(players_state, enemy_store, previous=None):
+    """Capture the current room state as {kind: {id: (x, y, health)}}.
+
+    With the previous snapshot, enemies that didn't move or take damage keep their record object.
+    """
+    snapshot = enemy_store.records(previous)
+    snapshot["players"] = {pid: (p.x, p.y, p.current_health) for pid, p in players_state.items()}
+    return snapshot
+
+
+def interest_view(snapshot, player_id, previous_view, radius, margin, nearby=None):
+    """The part of the snapshot the player should see.
+
+    Entities enter the view inside radius and only leave it beyond radius + margin,
+    so something walking along the edge doesn't flicker in and out.
+    nearby is an optional {kind: ids} from a spatial index (everything within radius + margin);
+    those kinds only check the candidates instead of every entity in the room.
+    """
+    own = snapshot["players"].get(player_id)
+    if own is None:
+        return empty_state()
+    cx, cy = own[0], own[1]
+    enter_sq = radius ** 2
+    leave_sq = (radius + margin) ** 2
+
+    view = {}
+    for kind in ENTITY_KINDS:
+        previous = previous_view[kind] if previous_view else {}
+        records = {}
+        if nearby is not None and kind in nearby:
+            items = ((k, snapshot[kind][k]) for k in nearby[kind] if k in snapshot[kind])
+        else:
+            items = snapshot[kind].items()
+        for k, rec in items:
+            dist_sq = (rec[0] - cx) ** 2 + (rec[1] - cy) ** 2
+            if dist_sq <= enter_sq or (dist_sq <= leave_sq and k in previous):
+                records[k] = rec
+        view[kind] = records
+    view["players"][player_id] = own
+    return view
+
+
+def _player_records(records):
+    return {pid: {"x": x, "y": y, "health": health} for pid, (x, y, health) in records.items()}
+
+
+def _entity_records(kind, records, cache=None):
+    if cache is None:
+        return [{"id": k, "x": x, "y": y, "health": health} for k, (x, y, health) in records.items()]
+    return [cache.record(kind, k, rec) for k, rec in records.items()]
+
+
+class WireRecord(dict):
+    """{"id", "x", "y", "health"} of an enemy that also keeps its encoded form per codec."""
+    __slots__ = ("rec", "fragments")
+
+
+class RecordCache:
+    """The message records of a room's enemies, rebuilt only when their (x, y, health) changes.
+
+    Snapshots reuse the tuple of an enemy that didn't change (see EnemyStore.records), so an
+    identity check is enough. The same WireRecord, and the fragments the codecs cached on it,
+    are then shared by every client and every update until the enemy moves or is hit again.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (kind, id) -> WireRecord
+
+    def record(self, kind, k, rec):
+        entry = self.entries.get((kind, k))
+        if entry is None or entry.rec is not rec:
+            entry = WireRecord(id=k, x=rec[0], y=rec[1], health=rec[2])
+            entry.rec = rec
+            entry.fragments = {}
+            self.entries[(kind, k)] = entry
+        return entry
+
+    def prune(self, snapshot):
+        """Drop the entries of enemies that are gone, once there are enough of them to matter."""
+        alive = len(snapshot["enemies"]) + len(snapshot["cultists"])
+        if len(self.entries) > 2 * alive + 64:
+            self.entries = {key: entry for key, entry in self.entries.items() if key[1] in snapshot[key[0]]}
+
+
+def diff_views(baseline, view, snapshot):
+    """What the client needs to get from the baseline view to view.
+
+    Returns (changed, leave, removed): the records whose x/y/health changed or that are new,
+    the ids that left the view but still exist in the room (snapshot) and the ids gone from the room.
+    """
+    changed, leave, removed = {}, {}, {}
+    for kind in ENTITY_KINDS:
+        old, new = baseline[kind], view[kind]
+        changed[kind] = {k: rec for k, rec in new.items() if old.get(k) != rec}
+        for k in old:
+            if k not in new:
+                (leave if k in snapshot[kind] else removed).setdefault(kind, []).append(k)
+    return changed, leave, removed
+
+
+def merge_view(baseline, changed, leave, removed):
+    """The view the client holds once it applied the message built from these parts."""
+    view = {}
+    for kind in ENTITY_KINDS:
+        records = dict(baseline[kind])
+        records.update(changed[kind])
+        for ids in (leave.get(kind, ()), removed.get(kind, ())):
+            for k in ids:
+                records.pop(k, None)
+        view[kind] = records
+    return view
+
+
+def prioritise(changed, priorities, player_id, center, last_snapshot, max_records, radius):
+    """Keep at most max_records changed entities, by accumulated priority.
+
+    Every entity that is waiting to be sent gains priority each snapshot, more when it is
+    near the player and when it changed this tick, so everything is eventually sent but the
+    nearest and freshest changes go first. The player's own record is always kept.
+    """
+    cx, cy = center
+    candidates = []
+    for kind in ENTITY_KINDS:
+        previous = last_snapshot[kind] if last_snapshot else {}
+        for k, rec in changed[kind].items():
+            if kind == "players" and k == player_id:
+                continue
+            nearness = max(0.0, 1 - ((rec[0] - cx) ** 2 + (rec[1] - cy) ** 2) ** 0.5 / radius)
+            priority = priorities.get((kind, k), 0) + 1 + NEAR_WEIGHT * nearness
+            if previous.get(k) != rec:
+                priority += RECENT_CHANGE_WEIGHT
+            priorities[(kind, k)] = priority
+            candidates.append((priority, kind, k))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    selected = empty_state()
+    if player_id in changed["players"]:
+        selected["players"][player_id] = changed["players"][player_id]
+    for _, kind, k in candidates[:max(0, max_records)]:
+        selected[kind][k] = changed[kind][k]
+        priorities.pop((kind, k))
+    return selected
+
+
+def state_message(seq, baseline_seq, baseline, changed, leave, removed, cache=None):
+    """state_update from the parts returned by diff_views (baseline_seq None for a keyframe).
+
+    Records that were not in the baseline view are listed under "enter". With a RecordCache
+    the enemy records are the cached ones.
+    """
+    msg = {"type": "state_update", "seq": seq, "baseline": baseline_seq,
+           "players": _player_records(changed["players"]),
+           "enemies": _entity_records("enemies", changed["enemies"], cache),
+           "cultists": _entity_records("cultists", changed["cultists"], cache)}
+    if baseline_seq is not None:
+        enter = {}
+        for kind in ENTITY_KINDS:
+            entered = [k for k in changed[kind] if k not in baseline[kind]]
+            if entered:
+                enter[kind] = entered
+        if enter:
+            msg["enter"] = enter
+    if leave:
+        msg["leave"] = leave
+    if removed:
+        msg["removed"] = removed
+    return msg
+
+
+def keyframe_message(seq, view, cache=None):
+    """Full view, used when the client has no usable baseline."""
+    return state_message(seq, None, empty_state(), view, {}, {}, cache)
+
+
+def empty_state():
+    return {kind: {} for kind in ENTITY_KINDS}
+
+
+def apply_state_update(snapshots, msg):
+    """Client side: rebuild the full state for msg["seq"] from its baseline.
+
+    snapshots maps seq -> state ({"players": {pid: rec}, "enemies": {id: rec}, "cultists": {id: rec}}).
+    Returns None if the baseline is no longer known.
+    """
+    baseline_seq = msg.get("baseline")
+    if baseline_seq is None:
+        state = empty_state()
+    else:
+        baseline = snapshots.get(baseline_seq)
+        if baseline is None:
+            return None
+        state = {kind: dict(records) for kind, records in baseline.items()}
+
+    state["players"].update(msg["players"])
+    for rec in msg["enemies"]:
+        state["enemies"][rec["id"]] = rec
+    for rec in msg["cultists"]:
+        state["cultists"][rec["id"]] = rec
+    for key in ("leave", "removed"):
+        for kind, ids in msg.get(key, {}).items():
+            for k in ids:
+                state[kind].pop(k, None)
+    return state
@@ -0,0 +1,72 @@
+GRID_CELL_SIZE = 128  # px, about the reach of an enemy attack
+
+
+class UniformGrid:
+    """Spatial hash of points in square cells, updated incrementally as entities move.
+
+    Keys are whatever identifies the entity in the room (a player id, ("enemies", id), ...).
+    A move that stays inside its cell only updates the stored position.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}      # (cx, cy) -> {key: (x, y)}
+        self.positions = {}  # key -> (x, y, cell)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, key, x, y):
+        cell = self._cell(x, y)
+        old = self.positions.get(key)
+        if old is not None and old[2] != cell:
+            self._remove_from_cell(key, old[2])
+        self.cells.setdefault(cell, {})[key] = (x, y)
+        self.positions[key] = (x, y, cell)
+
+    move = insert
+
+    def remove(self, key):
+        old = self.positions.pop(key, None)
+        if old is not None:
+            self._remove_from_cell(key, old[2])
+
+    def _remove_from_cell(self, key, cell):
+        bucket = self.cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.cells[cell]
+
+    def query_rect(self, x0, y0, x1, y1):
+        """Keys of the points inside the rectangle (edges included)."""
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    found.extend(key for key, (x, y) in bucket.items() if x0 <= x <= x1 and y0 <= y <= y1)
+        return found
+
+    def query_radius(self, x, y, radius):
+        r_sq = radius ** 2
+        return [key for key in self.query_rect(x - radius, y - radius, x + radius, y + radius)
+                if (self.positions[key][0] - x) ** 2 + (self.positions[key][1] - y) ** 2 <= r_sq]
+
+    def any_within(self, x, y, radius):
+        r_sq = radius ** 2
+        cx0, cy0 = self._cell(x - radius, y - radius)
+        cx1, cy1 = self._cell(x + radius, y + radius)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for px, py in self.cells.get((cx, cy), {}).values():
+                    if (px - x) ** 2 + (py - y) ** 2 <= r_sq:
+                        return True
+        return False
@@ -0,0 +1,122 @@
+import math
+import random
+from collections import deque
+from functools import lru_cache
+
+SPAWN_SPACING = 40  # px between two spawn candidates
+WAVE_COUNT = 3
+WAVE_INTERVAL = 30  # seconds between waves, the next one comes early if the map is cleared
+WAVE_GROWTH = 2  # every wave is this many times the previous one
+MAX_SPAWNS_PER_TICK = 4  # a big wave is spread over several ticks
+PICK_ATTEMPTS = 8  # candidates tried per spawn before waiting for the next tick
+
+
+@lru_cache(maxsize=None)
+def spawn_candidates(x0, y0, x1, y1, spacing=SPAWN_SPACING, seed=0):
+    """Poisson-disk points in the rectangle (Bridson), no two closer than spacing.
+
+    Computed once per map and shared by every room; returned in a random order.
+    """
+    rng = random.Random(seed)
+    cell = spacing / math.sqrt(2)
+    grid = {}
+    points = []
+    active = []
+
+    def add(p):
+        points.append(p)
+        active.append(p)
+        grid[(int((p[0] - x0) // cell), int((p[1] - y0) // cell))] = p
+
+    def fits(p):
+        if not (x0 <= p[0] <= x1 and y0 <= p[1] <= y1):
+            return False
+        cx, cy = int((p[0] - x0) // cell), int((p[1] - y0) // cell)
+        for gx in range(cx - 2, cx + 3):
+            for gy in range(cy - 2, cy + 3):
+                q = grid.get((gx, gy))
+                if q and (q[0] - p[0]) ** 2 + (q[1] - p[1]) ** 2 < spacing ** 2:
+                    return False
+        return True
+
+    add((rng.uniform(x0, x1), rng.uniform(y0, y1)))
+    while active:
+        i = rng.randrange(len(active))
+        px, py = active[i]
+        for _ in range(30):
+            angle = rng.uniform(0, 2 * math.pi)
+            r = rng.uniform(spacing, 2 * spacing)
+            p = (px + r * math.cos(angle), py + r * math.sin(angle))
+            if fits(p):
+                add(p)
+                break
+        else:
+            active[i] = active[-1]
+            active.pop()
+
+    points = [(round(x), round(y)) for x, y in points]
+    rng.shuffle(points)
+    return tuple(points)
+
+
+class SpawnDirector:
+    """Spawns the enemies of a room in waves, a few per tick.
+
+    Positions come from the precomputed candidates: a cursor walks through them and the first one
+    with no player within min_distance is taken, so a pick is a handful of grid lookups and two
+    spawns in a row never land on the same point.
+    """
+
+    def __init__(self, candidates, first_wave, min_distance, waves=WAVE_COUNT, interval=WAVE_INTERVAL,
+                 growth=WAVE_GROWTH, per_tick=MAX_SPAWNS_PER_TICK):
+        self.candidates = candidates
+        self.cursor = 0
+        self.min_distance = min_distance
+        self.wave_size = first_wave
+        self.waves_left = waves
+        self.interval = interval
+        self.growth = growth
+        self.per_tick = per_tick
+        self.next_wave_at = None
+        self.pending = deque()  # kinds still to spawn from the current waves
+        self.next_id = 0
+        self.wave = 0
+
+    def start(self, now):
+        self.next_wave_at = now
+
+    def done(self):
+        """True once every wave has been spawned."""
+        return not self.waves_left and not self.pending
+
+    def pick(self, player_grid):
+        for _ in range(PICK_ATTEMPTS):
+            x, y = self.candidates[self.cursor]
+            self.cursor = (self.cursor + 1) % len(self.candidates)
+            if not player_grid.any_within(x, y, self.min_distance):
+                return x, y
+        return None
+
+    def update(self, now, enemy_store, player_grid):
+        """Queue the waves that are due and spawn up to per_tick enemies. Returns how many spawned."""
+        if self.next_wave_at is None:
+            return 0
+        if self.waves_left and (now >= self.next_wave_at or (not len(enemy_store) and not self.pending)):
+            for _ in range(int(self.wave_size)):
+                self.pending.append("enemies" if self.next_id % 2 == 0 else "cultists")
+                self.next_id += 1
+            self.wave += 1
+            self.waves_left -= 1
+            self.wave_size *= self.growth
+            self.next_wave_at = now + self.interval
+            print(f"Wave {self.wave}: {len(self.pending)} enemies to spawn")
+
+        spawned = 0
+        while self.pending and spawned < self.per_tick:
+            position = self.pick(player_grid)
+            if position is None:
+                break  # the players are all over the candidates, try again next tick
+            k = self.next_id - len(self.pending)
+            enemy_store.add(self.pending.popleft(), k, *position)
+            spawned += 1
+        return spawned
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_server_doesnt_import_pygame():
+    # the server only needs the sim package, pygame is for the client
+    result = subprocess.run([sys.executable, "-c", "import paths, sys; assert 'pygame' not in sys.modules"],
+                            cwd=SERVER_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 30  # seconds for the router and the shard processes to come up
+
+
+def free_ports(count):
+    """count consecutive free ports, the shards take base, base + 1, ..."""
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + count > 65535:
+            continue
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def post(url):
+    return json.load(urllib.request.urlopen(urllib.request.Request(url, method="POST"), timeout=10))
+
+
+def wait_for(url, deadline):
+    while True:
+        try:
+            return urllib.request.urlopen(url, timeout=1).read()
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+async def play(joins):
+    """Open the websocket of every join, returns the first message of each."""
+    sockets = [await websockets.connect(f"{j['ws_url']}/{j['room_id']}/{j['player_id']}") for j in joins]
+    try:
+        return [json.loads(await asyncio.wait_for(ws.recv(), 10)) for ws in sockets]
+    finally:
+        for ws in sockets:
+            await ws.close()
+
+
+def test_router_with_two_shards():
+    # the router and two shards as local processes, the players join through the router
+    router_port = free_ports(1)
+    shard_port = free_ports(2)
+    env = dict(os.environ, GAME_ROUTER_PORT=str(router_port), GAME_SHARD_BASE_PORT=str(shard_port), GAME_SHARDS="2")
+    env.pop("GAME_HANDOFF_SOCKET", None)
+    env.pop("GAME_SIM_WORKERS", None)
+    router = subprocess.Popen([sys.executable, "sharding.py"], cwd=SERVER_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + STARTUP_TIMEOUT
+        wait_for(f"http://127.0.0.1:{router_port}/shards", deadline)
+        for port in (shard_port, shard_port + 1):
+            wait_for(f"http://127.0.0.1:{port}/rooms", deadline)
+
+        # two rooms of two players: the first room fills up before the next one is made
+        joins = [post(f"http://127.0.0.1:{router_port}/join") for _ in range(4)]
+        assert joins[0]["room_id"] == joins[1]["room_id"]
+        assert joins[2]["room_id"] == joins[3]["room_id"] != joins[0]["room_id"]
+        for j in joins:
+            assert j["ws_url"] == f"ws://127.0.0.1:{shard_port + j['shard']}/ws/game"
+            assert j["room_id"].startswith(f"{j['shard']}-")  # the shard that owns the room
+
+        first = asyncio.run(play(joins))
+        assert [msg["type"] for msg in first] == ["start_game"] * 4
+
+        shards = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{router_port}/shards", timeout=5).read())
+        assert [s["alive"] for s in shards] == [True, True]
+    finally:
+        router.terminate()
+        router.wait(10)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+from GameRooms import room_manager
+from snapshots import apply_state_update
+from udp_transport import SnapshotServerProtocol, SnapshotClientProtocol
+
+LOSS_RATE = 0.3  # of the snapshot datagrams, like GAME_UDP_LOSS_RATE
+RUN_TIME = 3  # seconds of game
+
+
+class FakeSocket:
+    """The player's WebSocket: events and the state updates too big for a datagram end up here."""
+
+    def __init__(self, on_state=None):
+        self.on_state = on_state
+
+    async def send_text(self, text):
+        msg = json.loads(text)
+        if msg["type"] == "state_update" and self.on_state:
+            self.on_state(msg)
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+def as_view(state):
+    """Client state in the server's view format, {kind: {id: (x, y, health)}}."""
+    return {kind: {k: (r["x"], r["y"], r["health"]) for k, r in records.items()} for kind, records in state.items()}
+
+
+async def play_with_loss():
+    loop = asyncio.get_running_loop()
+    server_transport, server = await loop.create_datagram_endpoint(
+        lambda: SnapshotServerProtocol(LOSS_RATE), local_addr=("127.0.0.1", 0))
+    port = server_transport.get_extra_info("sockname")[1]
+
+    snapshots = {}  # the client's seq -> state
+    applied = []  # (seq, baseline, the client's state, the view the server recorded for seq)
+    last_seq = -1
+
+    def on_state(msg):
+        # what gameClient.apply_state_update does: rebuild from the baseline, keep it, ack it
+        nonlocal last_seq
+        if msg["seq"] <= last_seq:
+            return
+        state = apply_state_update(snapshots, msg)
+        if state is None:
+            return  # baseline already dropped, a keyframe will come
+        last_seq = msg["seq"]
+        snapshots[msg["seq"]] = state
+        applied.append((msg["seq"], msg["baseline"], as_view(state), connection.views.get(msg["seq"])))
+        room.ack_snapshot("p0", msg["seq"])
+
+    room_id = await room_manager.join(lambda: "udp-loss")
+    room = room_manager.get(room_id)
+    await room.add_player("p0", FakeSocket(on_state))
+    await room_manager.join(lambda: "udp-loss")
+    await room.add_player("p1", FakeSocket())
+    connection = room.players["p0"]
+
+    ready = asyncio.Event()
+    original_enqueue = connection.enqueue
+
+    def enqueue(payload, reliable=True, seq=None):
+        if '"udp_ready"' in str(payload):
+            ready.set()
+        original_enqueue(payload, reliable, seq)
+    connection.enqueue = enqueue
+    sent = []  # seqs of the state updates sent to p0
+    original_send_state = connection.send_state
+
+    def send_state(seq, payload):
+        sent.append(seq)
+        original_send_state(seq, payload)
+    connection.send_state = send_state
+
+    token = connection.offer_udp(server)
+    client_transport, client = await loop.create_datagram_endpoint(
+        lambda: SnapshotClientProtocol(token, lambda payload: on_state(json.loads(payload))),
+        remote_addr=("127.0.0.1", port))
+    await client.say_hello()
+    await asyncio.wait_for(ready.wait(), 5)
+
+    for i in range(int(RUN_TIME * 30)):
+        room.queue_input("p0", i, 10 if i % 40 < 20 else -10, 5)  # keep the views changing
+        await asyncio.sleep(1 / 30)
+    latest = room.snapshot_seq
+
+    client_transport.close()
+    await room.shutdown()
+    server_transport.close()
+    return applied, sent, latest
+
+
+def test_client_converges_under_udp_loss():
+    applied, sent, latest = asyncio.run(play_with_loss())
+    seqs = [seq for seq, _, _, _ in applied]
+    assert len(applied) > 10
+    # some updates were lost on the way, yet the client keeps up with the newest ones
+    assert len(set(sent) - set(seqs)) >= len(sent) * LOSS_RATE / 3
+    assert latest - seqs[-1] <= 5
+    # deltas against acked baselines, not only keyframes
+    assert sum(baseline is not None for _, baseline, _, _ in applied) > len(applied) // 2
+    # every state the client rebuilt is exactly the view the server thinks it holds
+    for seq, _, state, view in applied:
+        assert view is not None
+        assert state == view, seq
@@ -0,0 +1,105 @@
+# Optional UDP side channel for the state updates, so a lost packet doesn't hold back every
+# later update the way it does on the WebSocket (TCP). Reliable events keep using the WebSocket.
+#
+# Negotiation, after the WebSocket is up:
+#   client -> ws:  {"type": "udp_request"}
+#   server -> ws:  {"type": "udp_offer", "port": ..., "token": ...}   (or "udp_unavailable")
+#   client -> udp: HELLO + token, repeated until the server confirms
+#   server -> ws:  {"type": "udp_ready"}
+# From then on the state updates come as SNAPSHOT datagrams, numbered with the snapshot seq.
+# Acks still go over the WebSocket, so the deltas stay against a baseline the client really has.
+import asyncio
+import random
+import struct
+import uuid
+
+MAX_DATAGRAM_SIZE = 1200  # bigger state updates go over the WebSocket instead of being fragmented
+HELLO_INTERVAL = 0.2  # seconds between the client's hello datagrams
+HELLO_ATTEMPTS = 10
+
+HELLO = 1
+SNAPSHOT = 2
+
+_header = struct.Struct("<BI")  # kind, seq (0 for a hello)
+
+
+class SnapshotServerProtocol(asyncio.DatagramProtocol):
+    """Server end: matches hello datagrams to the offered tokens and sends snapshots.
+
+    loss_rate drops that share of the outgoing snapshots, to try the game on a bad link.
+    """
+
+    def __init__(self, loss_rate=0.0):
+        self.transport = None
+        self.loss_rate = loss_rate
+        self.offers = {}  # token -> callback(addr) waiting for the client's hello
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def offer(self, on_ready):
+        token = uuid.uuid4().bytes
+        self.offers[token] = on_ready
+        return token.hex()
+
+    def forget(self, token):
+        self.offers.pop(bytes.fromhex(token), None)
+
+    def datagram_received(self, data, addr):
+        if len(data) < _header.size:
+            return
+        kind, _ = _header.unpack_from(data)
+        if kind != HELLO:
+            return
+        on_ready = self.offers.pop(data[_header.size:], None)
+        if on_ready:
+            on_ready(self, addr)
+
+    def send_snapshot(self, addr, seq, payload):
+        """False if the payload doesn't fit in one datagram."""
+        if len(payload) + _header.size > MAX_DATAGRAM_SIZE:
+            return False
+        if self.loss_rate and random.random() < self.loss_rate:
+            return True
+        self.transport.sendto(_header.pack(SNAPSHOT, seq) + payload, addr)
+        return True
+
+
+class SnapshotClientProtocol(asyncio.DatagramProtocol):
+    """Client end: says hello with the token and hands newer snapshots to on_snapshot.
+
+    Datagrams that arrive after a newer one are dropped, the next delta covers them anyway.
+    """
+
+    def __init__(self, token, on_snapshot, loss_rate=0.0):
+        self.token = bytes.fromhex(token)
+        self.on_snapshot = on_snapshot
+        self.loss_rate = loss_rate
+        self.transport = None
+        self.last_seq = -1
+        self.ready = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    async def say_hello(self):
+        for _ in range(HELLO_ATTEMPTS):
+            if self.ready or self.transport is None or self.transport.is_closing():
+                return
+            self.transport.sendto(_header.pack(HELLO, 0) + self.token)
+            await asyncio.sleep(HELLO_INTERVAL)
+
+    def datagram_received(self, data, addr):
+        if len(data) < _header.size:
+            return
+        kind, seq = _header.unpack_from(data)
+        if kind != SNAPSHOT or seq <= self.last_seq:
+            return
+        if self.loss_rate and random.random() < self.loss_rate:
+            return
+        self.last_seq = seq
+        self.on_snapshot(data[_header.size:])
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
@@ -1,6 +1,8 @@
 import pygame
 import math
 
+from sim import slash_rect, SLASH_DURATION, SWORD_DAMAGE, BOW_DAMAGE, BOW_RANGE, BOW_ATTACK_SPEED
+
 
 class Weapon:
     def __init__(self, sprite_sheet_path, x, y, player_width, player_height, frame_width, frame_height, scale_factor=0.5, damage=10, description=""):
@@ -64,7 +66,7 @@ class Sword(Weapon):
         self.slash_index = 0
         self.slash_active = False
         self.slash_timer = 0
-        self.slash_duration = 0.2  # Duration of the slash animation in seconds
+        self.slash_duration = SLASH_DURATION  # Duration of the slash animation in seconds
 
     def load_slash_frames(self, sprite_sheet_path, frame_width=64, frame_height=64):
         """Load frames from the slash sprite sheet."""
@@ -85,8 +87,8 @@ class Sword(Weapon):
             self.slash_timer = 0
             print("Slash animation started!")
 
-    def update_slash(self, dt, player_x, player_y, facing_left, enemies, cultists):
-        """Update the slash animation and check for collisions."""
+    def update_slash(self, dt):
+        """Advance the slash animation, the hits are worked out by the server."""
         if self.slash_active:
             self.slash_timer += dt
             if self.slash_timer >= self.slash_duration:
@@ -95,34 +97,10 @@ class Sword(Weapon):
                 # Update the current frame of the slash animation
                 self.slash_index = int((self.slash_timer / self.slash_duration) * len(self.slash_frames))
 
-                # Check for collisions with enemies
-                slash_rect = self.get_slash_rect(player_x, player_y, facing_left)
-                enemies_taken_damage = []
-                cultists_taken_damage = []
-
-                for k, enemy in enemies.items():
-                    if slash_rect.colliderect(enemy.get_rect()):
-                        print(f"Enemy hit! Damage: {self.damage}")
-                        enemies_taken_damage.append([k, self.damage])
-                        # enemy.take_damage(self.damage)
-
-                for k, enemy in cultists.items():
-                    if slash_rect.colliderect(enemy.get_rect()):
-                        print(f"Cultist hit! Damage: {self.damage}")
-                        cultists_taken_damage.append([k, self.damage])
-
-                return enemies_taken_damage, cultists_taken_damage
-        return None
-
 
     def get_slash_rect(self, player_x, player_y, facing_left):
-        """Get the rectangle of the current slash frame."""
-        slash_frame = self.slash_frames[self.slash_index]
-        slash_width, slash_height = slash_frame.get_size()
-        if facing_left:
-            return pygame.Rect(player_x - self.width, player_y + self.height // 4, slash_width, slash_height)
-        else:
-            return pygame.Rect(player_x + self.width + 10, player_y + self.height // 4, slash_width, slash_height)
+        """Get the rectangle of the slash, the same one the server checks the hits with."""
+        return pygame.Rect(*slash_rect(player_x, player_y, facing_left, self.width, self.height))
 
         
     def draw(self, window, camera_x, camera_y, facing_left, player_x, player_y):
@@ -142,19 +120,33 @@ class Sword(Weapon):
 
 
 class Bow(Weapon):
-    def __init__(self, texture_path, x, y, player_width, player_height, scale_factor=0.5, rotation_angle=0, damage=15, range=300, attack_speed=1.5, description=""):
+    def __init__(self, texture_path, x, y, player_width, player_height, scale_factor=0.5, rotation_angle=0, damage=BOW_DAMAGE, range=BOW_RANGE, attack_speed=BOW_ATTACK_SPEED, description=""):
         super().__init__(texture_path, x, y, player_width, player_height, 64, 64, scale_factor, damage, description)
+        self.range = range
+        self.cooldown = 1 / attack_speed  # seconds between shots
+        self.last_shot = float('-inf')
+
+    def try_shoot(self, now):
+        """True if the bow is ready, the arrow itself is fired and flown by the server."""
+        if now - self.last_shot < self.cooldown:
+            return False
+        self.last_shot = now
+        return True
 
-    # Additional functionality for the bow (e.g., shooting arrows) can be added here
+    @staticmethod
+    def draw_arrow(window, camera_x, camera_y, x, y, vx, vy, length=14):
+        speed = (vx ** 2 + vy ** 2) ** 0.5 or 1
+        tail = (x - vx / speed * length - camera_x, y - vy / speed * length - camera_y)
+        pygame.draw.line(window, (200, 180, 120), tail, (x - camera_x, y - camera_y), 2)
 
 
 class Weapons:
     def __init__(self, player_width, player_height):
         # Initialize a list of weapons
         self.weapons = [
-            Bow("Game_models/Weapons/Bow.png", 0, 0, player_width, player_height, damage=15, range=300, attack_speed=1.5, description="A ranged weapon for long-distance attacks."),
+            Bow("Game_models/Weapons/Bow.png", 0, 0, player_width, player_height, description="A ranged weapon for long-distance attacks."),
             Sword("Game_models/Weapons/Sword.png",
-                  "Game_models/Animations/Slash.png", 0, 0, player_width, player_height, rotation_angle=-80, damage=1, range=50, attack_speed=1.0, description="A melee weapon for close combat.")
+                  "Game_models/Animations/Slash.png", 0, 0, player_width, player_height, rotation_angle=-80, damage=SWORD_DAMAGE, range=50, attack_speed=1.0, description="A melee weapon for close combat.")
         ]
         self.active_weapon_index = 0 
 
@@ -0,0 +1,195 @@
+# Wire formats for the room traffic. The client picks one per connection when it opens the
+# WebSocket, through a query parameter (see paths.websocket_endpoint). JSON stays the default
+# because it is readable while debugging; the binary one packs the hot messages (state_update, move, ack)
+# with a message-type byte, int16 quantized positions and small player handles instead of
+# the UUID strings. Every other message goes through cbor2.
+import json
+import struct
+
+import cbor2
+
+JSON_ENCODING = "json"
+BINARY_ENCODING = "binary"
+
+# message type byte
+MSG_STATE_UPDATE = 1
+MSG_MOVE = 2
+MSG_ACK = 3
+MSG_CBOR = 255
+
+POSITION_SCALE = 2  # positions are sent in half pixels
+INT16_MIN, INT16_MAX = -32768, 32767
+NO_SEQ = 0xFFFFFFFF  # baseline / input seq that is None
+
+KINDS = ("players", "enemies", "cultists")
+ID_LISTS = ("removed", "enter", "leave")  # optional id lists of a state_update, bit i of the header flags
+
+_type = struct.Struct("<B")
+_state_header = struct.Struct("<BIdIIHHHB")  # type, seq, server time, baseline, input seq, players, enemies, cultists, id lists
+_record = struct.Struct("<Hhhh")           # handle / id, x, y, health
+_id_list_header = struct.Struct("<HHH")    # players, enemies, cultists
+_id = struct.Struct("<H")
+_move = struct.Struct("<BIhh")
+_ack = struct.Struct("<BI")
+
+
+def quantize(value):
+    return max(INT16_MIN, min(INT16_MAX, round(value * POSITION_SCALE)))
+
+
+def dequantize(value):
+    return value / POSITION_SCALE
+
+
+def _clamp16(value):
+    return max(INT16_MIN, min(INT16_MAX, int(value)))
+
+
+def _json_record(e):
+    return json.dumps(e, separators=(",", ":"))
+
+
+def _binary_record(e):
+    return _record.pack(e["id"], quantize(e["x"]), quantize(e["y"]), _clamp16(e["health"]))
+
+
+def _has_fragments(msg):
+    """True if the enemy records are cached ones, the lists are either all cached or not at all."""
+    return any(hasattr(msg[kind][0], "fragments") for kind in ("enemies", "cultists") if msg[kind])
+
+
+def _fragment(codec_name, e, encode):
+    """Encoded enemy record, taken from / kept on the record when it is a cached one (snapshots.WireRecord)."""
+    fragments = getattr(e, "fragments", None)
+    if fragments is None:
+        return encode(e)
+    fragment = fragments.get(codec_name)
+    if fragment is None:
+        fragment = fragments[codec_name] = encode(e)
+    return fragment
+
+
+class JsonCodec:
+    name = JSON_ENCODING
+    record_size = 45  # rough bytes per entity in a state_update, for the per-client byte budget
+
+    def set_handles(self, handles):
+        pass
+
+    def encode(self, msg):
+        if msg["type"] == "state_update" and _has_fragments(msg):
+            return self._encode_state(msg)
+        return json.dumps(msg, separators=(",", ":"))
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def _encode_state(self, msg):
+        # the enemy lists are spliced in from the records' cached fragments
+        head = json.dumps({key: value for key, value in msg.items() if key not in ("enemies", "cultists")},
+                          separators=(",", ":"))
+        parts = [head[:-1]]
+        for kind in ("enemies", "cultists"):
+            parts.append(',"%s":[%s]' % (kind, ",".join(_fragment(self.name, e, _json_record) for e in msg[kind])))
+        parts.append("}")
+        return "".join(parts)
+
+
+class BinaryCodec:
+    name = BINARY_ENCODING
+    record_size = _record.size
+
+    def __init__(self, handles=None):
+        self.handles = {}     # player_id -> handle
+        self.player_ids = {}  # handle -> player_id
+        if handles:
+            self.set_handles(handles)
+
+    def set_handles(self, handles):
+        """handles maps player_id -> small int, the server sends it with start_game."""
+        self.handles = handles
+        self.player_ids = {h: pid for pid, h in handles.items()}
+
+    def encode(self, msg):
+        msg_type = msg["type"]
+        if msg_type == "state_update":
+            return self._encode_state(msg)
+        if msg_type == "move":
+            return _move.pack(MSG_MOVE, msg["seq"], quantize(msg["dx"]), quantize(msg["dy"]))
+        if msg_type == "ack":
+            return _ack.pack(MSG_ACK, msg["seq"])
+        return _type.pack(MSG_CBOR) + cbor2.dumps(msg)
+
+    def decode(self, data):
+        msg_type = data[0]
+        if msg_type == MSG_STATE_UPDATE:
+            return self._decode_state(data)
+        if msg_type == MSG_MOVE:
+            _, seq, dx, dy = _move.unpack_from(data)
+            return {"type": "move", "seq": seq, "dx": dequantize(dx), "dy": dequantize(dy)}
+        if msg_type == MSG_ACK:
+            _, seq = _ack.unpack_from(data)
+            return {"type": "ack", "seq": seq}
+        return cbor2.loads(data[1:])
+
+    def _encode_state(self, msg):
+        players = msg["players"]
+        baseline, input_seq = msg["baseline"], msg.get("input_seq")
+        id_lists = [key for key in ID_LISTS if msg.get(key)]
+        flags = sum(1 << ID_LISTS.index(key) for key in id_lists)
+        parts = [_state_header.pack(MSG_STATE_UPDATE, msg["seq"], msg.get("t", 0.0), NO_SEQ if baseline is None else baseline,
+                                    NO_SEQ if input_seq is None else input_seq, len(players), len(msg["enemies"]), len(msg["cultists"]), flags)]
+        for pid, p in players.items():
+            parts.append(_record.pack(self.handles[pid], quantize(p["x"]), quantize(p["y"]), _clamp16(p["health"])))
+        for kind in ("enemies", "cultists"):
+            parts.extend(_fragment(self.name, e, _binary_record) for e in msg[kind])
+
+        for key in id_lists:
+            by_kind = msg[key]
+            ids = [[self.handles[pid] for pid in by_kind.get("players", ())],
+                   by_kind.get("enemies", ()), by_kind.get("cultists", ())]
+            parts.append(_id_list_header.pack(*(len(i) for i in ids)))
+            for kind_ids in ids:
+                parts.extend(_id.pack(i) for i in kind_ids)
+        return b"".join(parts)
+
+    def _decode_state(self, data):
+        _, seq, t, baseline, input_seq, n_players, n_enemies, n_cultists, flags = _state_header.unpack_from(data)
+        offset = _state_header.size
+        records = _record.iter_unpack(data[offset:offset + _record.size * (n_players + n_enemies + n_cultists)])
+
+        players = {}
+        for _ in range(n_players):
+            handle, x, y, health = next(records)
+            players[self.player_ids[handle]] = {"x": dequantize(x), "y": dequantize(y), "health": health}
+        msg = {"type": "state_update", "seq": seq, "t": t, "baseline": None if baseline == NO_SEQ else baseline,
+               "input_seq": None if input_seq == NO_SEQ else input_seq, "players": players}
+        for kind, count in (("enemies", n_enemies), ("cultists", n_cultists)):
+            entities = []
+            for _ in range(count):
+                k, x, y, health = next(records)
+                entities.append({"id": k, "x": dequantize(x), "y": dequantize(y), "health": health})
+            msg[kind] = entities
+
+        offset += _record.size * (n_players + n_enemies + n_cultists)
+        for bit, key in enumerate(ID_LISTS):
+            if not flags & (1 << bit):
+                continue
+            counts = _id_list_header.unpack_from(data, offset)
+            offset += _id_list_header.size
+            by_kind = {}
+            for kind, count in zip(KINDS, counts):
+                ids = [i for (i,) in _id.iter_unpack(data[offset:offset + _id.size * count])]
+                offset += _id.size * count
+                if kind == "players":
+                    ids = [self.player_ids[h] for h in ids]
+                if ids:
+                    by_kind[kind] = ids
+            msg[key] = by_kind
+        return msg
+
+
+def make_codec(encoding=JSON_ENCODING):
+    if encoding == BINARY_ENCODING:
+        return BinaryCodec()
+    return JsonCodec()
@@ -0,0 +1,117 @@
+import time
+from collections import deque
+
+from GameRooms import GameRoom, TICK_RATE, INITIAL_HEALTH, MAX_PLAYER_SPEED, MAX_QUEUED_INPUTS
+from sim import SimPlayer
+from sim_workers import SnapshotRing, InputQueue, MOVE, SHOT, SWING, NO_SEQ, WORKER_POLL
+from snapshots import take_snapshot
+
+
+class WorkerRoom(GameRoom):
+    """The simulation half of a room, inside a worker process.
+
+    Same ticks as a GameRoom on the server, but the inputs come from the shared input queue,
+    every tick is published to the snapshot ring, and whatever the room would send to its
+    players goes back to the server as an event on the worker's pipe.
+    """
+
+    def __init__(self, room_id, connection, ring_name, inputs_name, players, now):
+        super().__init__(room_id)
+        self.connection = connection
+        self.ring = SnapshotRing(ring_name)
+        self.queue = InputQueue(inputs_name)
+        self.published = 0
+        for player_id, handle, x, y, health in players:
+            self.players[player_id] = None  # the socket stays on the server
+            self.player_handles[player_id] = handle
+            self.inputs[player_id] = deque(maxlen=MAX_QUEUED_INPUTS)
+            self.state[player_id] = SimPlayer(x, y, MAX_PLAYER_SPEED, INITIAL_HEALTH)
+            self.state[player_id].current_health = health
+            self.player_grid.insert(player_id, x, y)
+        self.handle_players = {handle: player_id for player_id, handle in self.player_handles.items()}
+        self.running = True
+        self.started_at = self.sim_time = self.last_input_at = now
+        self.director.start(now)
+
+    def send(self, player_id: str, msg, reliable=True):
+        self.connection.send(("send", self.room_id, player_id, msg, reliable))
+
+    def broadcast(self, msg, reliable=True):
+        self.connection.send(("broadcast", self.room_id, msg, reliable))
+
+    def end_game(self):
+        self.running = False
+        self.connection.send(("ended", self.room_id))
+
+    def wake(self):
+        self.last_input_at = time.monotonic()
+
+    def read_inputs(self):
+        for kind, handle, seq, a, b, c in self.queue.pop_all():
+            player_id = self.handle_players.get(handle)
+            if player_id is None:
+                continue
+            if kind == MOVE:
+                self.queue_input(player_id, seq, a, b)
+            elif kind == SHOT:
+                self.queue_shot(player_id, a, b)
+            elif kind == SWING and player_id in self.state and player_id not in self.swings:
+                # the server already worked out the rewind when the swing arrived
+                self.pending_swings[player_id] = (None if seq == NO_SEQ else seq, bool(a), b)
+                self.wake()
+
+    def step(self, now):
+        self.read_inputs()
+        if not self.running or not self.advance(now):
+            return
+        for dead_id in self.dead_players:
+            self.detach_player(dead_id)
+            self.connection.send(("died", self.room_id, dead_id))
+        self.dead_players.clear()
+
+        snapshot = take_snapshot(self.state, self.enemy_store, self.last_snapshot)
+        self.last_snapshot = snapshot
+        self.history.record(self.sim_time, snapshot)
+        self.published += 1
+        players = [(self.player_handles[pid], p.x, p.y, p.current_health, self.last_input_seq.get(pid))
+                   for pid, p in self.state.items()]
+        self.ring.publish(self.published, self.sim_time, players, self.enemy_store)
+
+    def close(self):
+        self.ring.close()
+        self.queue.close()
+
+
+def run_worker(connection):
+    """Entry point of a simulation worker: steps its rooms on the room tick and follows the server's commands.
+
+    time.monotonic() is the clock of the server's event loop as well, so the times line up.
+    """
+    rooms = {}
+    next_tick = time.monotonic()
+    while True:
+        timeout = max(0, min(next_tick - time.monotonic(), WORKER_POLL))
+        try:
+            if connection.poll(timeout):
+                while connection.poll():
+                    msg = connection.recv()
+                    if msg[0] == "add_room":
+                        rooms[msg[1]] = WorkerRoom(msg[1], connection, msg[2], msg[3], msg[4], time.monotonic())
+                    elif msg[0] == "remove_player" and msg[1] in rooms:
+                        rooms[msg[1]].detach_player(msg[2])
+                    elif msg[0] == "remove_room" and msg[1] in rooms:
+                        rooms.pop(msg[1]).close()
+        except EOFError:
+            return  # the server is gone
+
+        now = time.monotonic()
+        if now < next_tick:
+            continue
+        next_tick = now + TICK_RATE / 4
+        for room_id, room in list(rooms.items()):
+            try:
+                room.step(now)
+            except Exception as e:
+                print("Game loop error:", e)
+                rooms.pop(room_id).close()
+                connection.send(("ended", room_id))